@@ -1,15 +1,46 @@
 # backend/app.py
+import hashlib
 import os
-from typing import List, Optional, Dict, Tuple
-from fastapi import FastAPI, HTTPException, Query
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Dict, Tuple
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 import duckdb
+import orjson
+import numpy as np
 
 # Caminho do banco
 HERE = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.getenv("DB_PATH", os.path.join(HERE, "data", "operadora.duckdb"))
 
-app = FastAPI(title="Operadora KPIs", version="0.2.1")
+# orjson serializa em C (incluindo date/Decimal/numpy) — JSON de resposta
+# sai bem mais rápido que o json da stdlib nas séries maiores.
+app = FastAPI(title="Operadora KPIs", version="0.2.1", default_response_class=ORJSONResponse)
+
+# Tabelas esperadas no banco (as que o load_data.py carrega)
+TABELAS_BASE = ("beneficiario", "conta", "mensalidade", "prestador", "autorizacao")
+
+# Validação de competência declarada uma vez e reutilizada por todos os
+# endpoints: o regex roda uma única vez no parse de parâmetros do FastAPI.
+def competencia_query(obrigatoria: bool = True):
+    if obrigatoria:
+        return Query(..., pattern=r"^\d{4}-\d{2}$", description="YYYY-MM")
+    return Query(None, pattern=r"^\d{4}-\d{2}$", description="YYYY-MM (default: última)")
+
+# Universo fechado de colunas candidatas por papel. Declarado em módulo para
+# que o índice reverso (candidata -> coluna real) seja pré-computável.
+CAND_MES_CONTA = ("dt_mes_competencia", "dt_competencia")
+CAND_MES_MENSALIDADE = ("dt_competencia", "dt_mes_competencia")
+CAND_MES_AUTORIZACAO = ("dt_autorizacao", "dt_entrada")
+CAND_MES_GENERICO = ("dt_mes_competencia", "dt_competencia", "dt_autorizacao", "dt_entrada")
+CAND_VL_CONTA = ("vl_liberado",)
+CAND_VL_MENSALIDADE = ("vl_premio",)
+CAND_NOME_PRESTADOR = ("nome", "nm_prestador", "razao_social", "ds_prestador")
+CAND_PRESTADOR_CONTA = ("id_prestador", "id_prestador_pagamento", "id_prestador_envio")
 
 # CORS liberado (frontend ou testes via navegador/curl/Postman)
 app.add_middleware(
@@ -23,38 +54,170 @@ app.add_middleware(
 # -----------------------
 # Helpers de conexão/SQL
 # -----------------------
+# Conexão aberta uma única vez por processo; cada requisição recebe um cursor
+# (cursores DuckDB são baratos, thread-safe e compartilham buffer pool/catálogo).
+# Reabrir o arquivo a cada request pagava open + WAL + catálogo toda vez.
+_con: Optional[duckdb.DuckDBPyConnection] = None
+
 def con_ro() -> duckdb.DuckDBPyConnection:
-    try:
-        return duckdb.connect(DB_PATH, read_only=True)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Falha ao abrir DuckDB: {e}")
+    global _con
+    if _con is None:
+        try:
+            _con = duckdb.connect(DB_PATH, read_only=True)
+            # Tuning do engine (vale para todos os cursores): paralelismo
+            # intra-query explícito, teto de memória e cache de metadados
+            # quente entre requisições. Ajustável por env para cada deploy;
+            # read_only permite vários workers uvicorn no mesmo arquivo.
+            threads = int(os.getenv("DUCKDB_THREADS", os.cpu_count() or 4))
+            mem = os.getenv("DUCKDB_MEMORY_LIMIT", "4GB")
+            _con.execute(f"PRAGMA threads={threads}")
+            _con.execute(f"PRAGMA memory_limit='{mem}'")
+            _con.execute("PRAGMA enable_object_cache=true")
+            # A API só agrega (GROUP BY/SUM); sem ordem de inserção a
+            # preservar, o engine paraleliza mais à vontade.
+            _con.execute("PRAGMA preserve_insertion_order=false")
+            # Spill fora do diretório do banco: em deploy containerizado o
+            # volume do .duckdb costuma ser read-only.
+            tmpdir = os.getenv("DUCKDB_TEMP_DIRECTORY", "/tmp/duckdb")
+            _con.execute(f"PRAGMA temp_directory='{tmpdir}'")
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"Falha ao abrir DuckDB: {e}")
+    return _con.cursor()
+
+# O schema é estático entre cargas (o banco é read-only para a API), então as
+# idas ao catálogo são memoizadas por processo — um KPI chegava a fazer ~10
+# consultas de catálogo por requisição. /admin/schema_reload limpa os caches
+# depois de rodar o load_data.py.
+@lru_cache(maxsize=None)
+def _schema_snapshot() -> Dict[str, Tuple[str, ...]]:
+    # Uma única ida ao catálogo enche o cache para TODAS as tabelas e
+    # colunas, em vez de uma consulta por tabela (PRAGMA table_info) mais
+    # uma por checagem de existência. duckdb_columns() lê o catálogo
+    # direto, sem passar pela view de compatibilidade information_schema.
+    with con_ro() as c:
+        rows = c.execute(
+            "SELECT lower(table_name), column_name "
+            "FROM duckdb_columns() "
+            "WHERE schema_name = 'main' AND NOT internal "
+            "ORDER BY table_name, column_index"
+        ).fetchall()
+    schema: Dict[str, List[str]] = {}
+    for tabela, coluna in rows:
+        schema.setdefault(tabela, []).append(coluna)
+    return {t: tuple(cols) for t, cols in schema.items()}
+
+def table_exists(c: duckdb.DuckDBPyConnection, table: str) -> bool:
+    return table.lower() in _schema_snapshot()
 
 def table_columns(c: duckdb.DuckDBPyConnection, table: str) -> List[str]:
-    rows = c.execute(f"PRAGMA table_info('{table}')").fetchall()
-    # PRAGMA table_info retorna: (cid, name, type, notnull, dflt_value, pk)
-    return [r[1] for r in rows]
+    return list(_schema_snapshot().get(table.lower(), ()))
+
+def _safe_table(name: str) -> str:
+    # Whitelist contra o snapshot do catálogo antes de qualquer interpolação
+    # em SQL: só nomes de tabela que existem de fato passam, e o que volta é
+    # a chave canônica do snapshot (nunca o texto cru do cliente). Checagem
+    # O(1) em dict, sem nenhuma ida ao banco.
+    tabela = name.lower()
+    if tabela not in _schema_snapshot():
+        raise HTTPException(status_code=404, detail=f"Tabela '{name}' não existe.")
+    return tabela
+
+def invalidate_schema_cache() -> None:
+    _schema_snapshot.cache_clear()
+    _col_index.cache_clear()
+    compile_benef_filters.cache_clear()
+    cached_sql.cache_clear()
+    evolucao_sql.cache_clear()
+    resumo_cols.cache_clear()
+    resumo_sql.cache_clear()
+    _meses_da_tabela.cache_clear()
+    sin_por_dim_sql.cache_clear()
+
+@lru_cache(maxsize=None)
+def cached_sql(nome: str) -> str:
+    """
+    Templates SQL estáveis por endpoint, montados uma única vez por processo.
+    O PREPARE nativo do DuckDB vive no contexto de cada conexão e não é
+    compartilhado entre cursores, então o ganho aqui é não repetir a
+    introspecção de schema e a montagem de f-strings a cada request;
+    os valores continuam chegando por bind (?).
+    """
+    with con_ro() as c:
+        if nome == "sin_serie":
+            return sinistralidade_serie_sql(c)
+        if nome == "sin_media":
+            return f"""
+                SELECT mes, custo, receita,
+                       CASE WHEN receita <> 0 THEN custo / receita ELSE 0 END AS sinistralidade,
+                       SUM(custo) OVER () AS custo_total,
+                       SUM(receita) OVER () AS receita_total
+                FROM ({sinistralidade_serie_sql(c)}) s
+            """
+        if nome == "health":
+            presentes = [t for t in TABELAS_BASE if table_exists(c, t)]
+            if not presentes:
+                return "SELECT NULL AS tabela, NULL AS n WHERE false"
+            return " UNION ALL ".join(
+                f"SELECT '{t}' AS tabela, COUNT(*) AS n FROM {t}" for t in presentes
+            )
+    raise KeyError(f"template SQL desconhecido: {nome}")
 
-def pick_col(c: duckdb.DuckDBPyConnection, table: str, candidates: List[str]) -> str:
-    cols = set(table_columns(c, table))
+@lru_cache(maxsize=None)
+def _col_index(table: str) -> Dict[str, str]:
+    # Índice reverso lower(nome) -> nome real, montado uma vez por tabela a
+    # partir do snapshot: pick_col vira puro lookup em dict, sem construir
+    # um set de colunas a cada chamada.
+    idx: Dict[str, str] = {}
+    for col in _schema_snapshot().get(table.lower(), ()):
+        idx.setdefault(col.lower(), col)
+    return idx
+
+def pick_col(c: duckdb.DuckDBPyConnection, table: str, candidates) -> str:
+    idx = _col_index(table)
     for col in candidates:
-        if col in cols:
-            return col
+        achada = idx.get(col.lower())
+        if achada:
+            return achada
     raise HTTPException(
         status_code=400,
-        detail=f"Não encontrei {candidates} em '{table}'. Colunas disponíveis: {sorted(cols)}",
+        detail=f"Não encontrei {list(candidates)} em '{table}'. "
+               f"Colunas disponíveis: {sorted(idx.values())}",
     )
 
+def month_expr_sql(
+    c: duckdb.DuckDBPyConnection,
+    table: str,
+    date_candidates: List[str],
+    alias: str = "",
+) -> str:
+    """
+    Expressão SQL que entrega a competência 'YYYY-MM' da tabela: usa a coluna
+    'mes' materializada pelo load_data.py quando existir (referência direta,
+    sem parse por linha); senão cai em strftime sobre a coluna de data, com
+    TRY_CAST para funcionar tanto com DATE quanto com VARCHAR.
+    """
+    p = f"{alias}." if alias else ""
+    if "mes" in set(table_columns(c, table)):
+        return f"{p}mes"
+    col = pick_col(c, table, date_candidates)
+    return f"strftime(TRY_CAST({p}{col} AS DATE), '%Y-%m')"
+
+def conta_mes_expr(c: duckdb.DuckDBPyConnection, alias: str = "") -> str:
+    return month_expr_sql(c, "conta", CAND_MES_CONTA, alias)
+
+def mensalidade_mes_expr(c: duckdb.DuckDBPyConnection, alias: str = "") -> str:
+    return month_expr_sql(c, "mensalidade", CAND_MES_MENSALIDADE, alias)
+
 def latest_competencia(c: duckdb.DuckDBPyConnection) -> str:
-    # procura colunas de competência em conta e mensalidade
-    conta_mes_col = pick_col(c, "conta", ["dt_competencia", "dt_mes_competencia"])
-    mensal_mes_col = pick_col(c, "mensalidade", ["dt_competencia", "dt_mes_competencia"])
+    # MAX por tabela (empurrado para baixo do UNION): evita materializar e
+    # deduplicar todos os meses das duas tabelas só para pegar o maior.
     (ult,) = c.execute(
         f"""
-        SELECT MAX(mes)::VARCHAR
+        SELECT MAX(mes)
         FROM (
-          SELECT {conta_mes_col} AS mes FROM conta
-          UNION
-          SELECT {mensal_mes_col} AS mes FROM mensalidade
+          SELECT MAX({conta_mes_expr(c)}) AS mes FROM conta
+          UNION ALL
+          SELECT MAX({mensalidade_mes_expr(c)}) AS mes FROM mensalidade
         )
         """
     ).fetchone()
@@ -63,32 +226,288 @@ def latest_competencia(c: duckdb.DuckDBPyConnection) -> str:
     return ult
 
 def sum_sinistro_e_premio(c: duckdb.DuckDBPyConnection, competencia: str) -> Tuple[float, float]:
-    conta_mes_col = pick_col(c, "conta", ["dt_competencia", "dt_mes_competencia"])
-    mensal_mes_col = pick_col(c, "mensalidade", ["dt_competencia", "dt_mes_competencia"])
-    vl_lib = pick_col(c, "conta", ["vl_liberado"])
-    vl_pre = pick_col(c, "mensalidade", ["vl_premio"])
-
-    (sinistro,) = c.execute(
-        f"SELECT COALESCE(SUM({vl_lib}),0) FROM conta WHERE {conta_mes_col} = ?",
-        [competencia],
-    ).fetchone()
-    (premio,) = c.execute(
-        f"SELECT COALESCE(SUM({vl_pre}),0) FROM mensalidade WHERE {mensal_mes_col} = ?",
-        [competencia],
-    ).fetchone()
-    return float(sinistro or 0.0), float(premio or 0.0)
+    vl_lib = pick_col(c, "conta", CAND_VL_CONTA)
+    vl_pre = pick_col(c, "mensalidade", CAND_VL_MENSALIDADE)
+
+    # As duas varreduras são independentes; cursores separados executam em
+    # paralelo sobre o mesmo buffer pool (o DuckDB solta o GIL durante o scan).
+    def _soma(sql: str) -> float:
+        with con_ro() as cc:
+            (v,) = cc.execute(sql, [competencia]).fetchone()
+        return float(v or 0.0)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        f_sin = pool.submit(
+            _soma, f"SELECT COALESCE(SUM({vl_lib}),0) FROM conta WHERE {conta_mes_expr(c)} = ?"
+        )
+        f_pre = pool.submit(
+            _soma,
+            f"SELECT COALESCE(SUM({vl_pre}),0) FROM mensalidade WHERE {mensalidade_mes_expr(c)} = ?",
+        )
+        return f_sin.result(), f_pre.result()
+
+def sinistralidade_mv(
+    c: duckdb.DuckDBPyConnection, competencia: Optional[str]
+) -> Optional[Tuple[str, float, float]]:
+    """
+    (competencia, sinistro, receita) a partir da tabela kpi_sinistralidade_mensal
+    materializada pelo load_data.py — lookup de 1 linha em vez de re-escanear
+    conta e mensalidade. Devolve None se a tabela não existir (banco antigo),
+    deixando o chamador cair na agregação ao vivo.
+    """
+    if not table_exists(c, "kpi_sinistralidade_mensal"):
+        return None
+    cols = set(table_columns(c, "kpi_sinistralidade_mensal"))
+    if not {"competencia", "custo_vl_liberado", "receita_vl_premio"} <= cols:
+        return None
+    # substr cobre tanto competencia VARCHAR 'YYYY-MM' quanto DATE de bancos antigos
+    comp_expr = "substr(CAST(competencia AS VARCHAR), 1, 7)"
+    if competencia is None:
+        row = c.execute(
+            f"SELECT {comp_expr}, custo_vl_liberado, receita_vl_premio "
+            f"FROM kpi_sinistralidade_mensal ORDER BY competencia DESC LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+    else:
+        row = c.execute(
+            f"SELECT {comp_expr}, custo_vl_liberado, receita_vl_premio "
+            f"FROM kpi_sinistralidade_mensal WHERE {comp_expr} = ?",
+            [competencia],
+        ).fetchone()
+        if row is None:
+            return (competencia, 0.0, 0.0)
+    return (row[0], float(row[1] or 0.0), float(row[2] or 0.0))
+
+def sinistralidade_serie_sql(c: duckdb.DuckDBPyConnection) -> str:
+    """
+    SQL que devolve (mes, custo, receita) por competência, da mais recente
+    para a mais antiga, com LIMIT parametrizado. Prefere a tabela
+    kpi_sinistralidade_mensal; cai na agregação ao vivo em banco antigo.
+    """
+    if table_exists(c, "kpi_sinistralidade_mensal") and {
+        "competencia", "custo_vl_liberado", "receita_vl_premio"
+    } <= set(table_columns(c, "kpi_sinistralidade_mensal")):
+        return (
+            "SELECT substr(CAST(competencia AS VARCHAR), 1, 7) AS mes, "
+            "COALESCE(custo_vl_liberado, 0) AS custo, "
+            "COALESCE(receita_vl_premio, 0) AS receita "
+            "FROM kpi_sinistralidade_mensal ORDER BY competencia DESC LIMIT ?"
+        )
+    vl_lib = pick_col(c, "conta", CAND_VL_CONTA)
+    vl_pre = pick_col(c, "mensalidade", CAND_VL_MENSALIDADE)
+    return f"""
+        WITH custos AS (
+          SELECT {conta_mes_expr(c)} AS mes, SUM({vl_lib}) AS custo FROM conta GROUP BY 1
+        ), receitas AS (
+          SELECT {mensalidade_mes_expr(c)} AS mes, SUM({vl_pre}) AS receita FROM mensalidade GROUP BY 1
+        )
+        SELECT mes, COALESCE(custo, 0) AS custo, COALESCE(receita, 0) AS receita
+        FROM custos FULL OUTER JOIN receitas USING (mes)
+        WHERE mes IS NOT NULL
+        ORDER BY mes DESC LIMIT ?
+    """
 
 def prestador_nome_col(c: duckdb.DuckDBPyConnection) -> str:
-    return pick_col(c, "prestador", ["nome", "nm_prestador", "razao_social", "ds_prestador"])
+    return pick_col(c, "prestador", CAND_NOME_PRESTADOR)
+
+def autorizacao_mes_expr(c: duckdb.DuckDBPyConnection, alias: str = "") -> str:
+    return month_expr_sql(c, "autorizacao", CAND_MES_AUTORIZACAO, alias)
+
+# Filtros opcionais de beneficiário: nome do parâmetro -> colunas candidatas
+# (cobre tanto nomes "curtos" quanto os ds_* dos extratos da operadora).
+BENEF_FILTER_COLS: Dict[str, Tuple[str, ...]] = {
+    "produto": ("produto", "ds_produto"),
+    "uf": ("uf", "ds_estado"),
+    "cidade": ("cidade", "ds_municipio"),
+    "sexo": ("sexo", "ds_sexo"),
+    "faixa": ("faixa", "faixa_etaria"),
+}
+
+# Faixa etária no formato 'NN-NN' (intervalo fechado) ou 'NN+' (aberto).
+# Regex pré-compilada: valida em uma passada, sem try/except no caminho feliz.
+_FAIXA_RE = re.compile(r"^(\d{1,3})(?:-(\d{1,3})|\+)$")
+
+def parse_faixa(faixa: str) -> Tuple[int, Optional[int]]:
+    """Valida e decompõe a faixa etária; entrada inválida vira 400 explícito."""
+    m = _FAIXA_RE.match(faixa.strip())
+    if not m:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Faixa inválida: {faixa!r}. Use 'NN-NN' (ex.: 0-18) ou 'NN+' (ex.: 60+).",
+        )
+    idade_min = int(m.group(1))
+    idade_max = int(m.group(2)) if m.group(2) is not None else None
+    if idade_max is not None and idade_max < idade_min:
+        raise HTTPException(status_code=400, detail=f"Faixa inválida: {faixa!r} (mínimo maior que máximo).")
+    return idade_min, idade_max
+
+# Faixas etárias padrão do dashboard (e do rollup materializado na carga)
+BINS_PADRAO = "0-18,19-59,60+"
+
+@lru_cache(maxsize=32)
+def parse_bins(bins: str) -> Tuple[Tuple[str, int, Optional[int]], ...]:
+    """
+    '0-18,19-59,60+' -> ((rotulo, min, max|None), ...), validado via
+    parse_faixa. Memoizado por string: o parse em Python sai do caminho
+    quente — na prática só existe um punhado de valores distintos.
+    """
+    faixas = []
+    for parte in bins.split(","):
+        rotulo = parte.strip()
+        if not rotulo:
+            raise HTTPException(status_code=400, detail=f"Bins inválidos: {bins!r}")
+        idade_min, idade_max = parse_faixa(rotulo)
+        faixas.append((rotulo, idade_min, idade_max))
+    return tuple(faixas)
 
-def autorizacao_data_col(c: duckdb.DuckDBPyConnection) -> str:
-    # para filtrar por mês
-    return pick_col(c, "autorizacao", ["dt_autorizacao", "dt_entrada"])
+@lru_cache(maxsize=32)
+def faixa_case_sql(bins: str, idade_expr: str) -> str:
+    """CASE WHEN que rotula a idade com a faixa correspondente, um por bins."""
+    ramos = []
+    for rotulo, idade_min, idade_max in parse_bins(bins):
+        if idade_max is None:
+            ramos.append(f"WHEN {idade_expr} >= {idade_min} THEN '{rotulo}'")
+        else:
+            ramos.append(
+                f"WHEN {idade_expr} BETWEEN {idade_min} AND {idade_max} THEN '{rotulo}'"
+            )
+    return "CASE " + " ".join(ramos) + " END"
 
-def month_filter_sql(col: str) -> str:
-    # Filtro por competência 'YYYY-MM'
-    # Usamos strftime para ser independente do tipo (DATE/TIMESTAMP/STRING)
-    return f"strftime({col}, '%Y-%m') = ?"
+@lru_cache(maxsize=32)
+def compile_benef_filters(keys: Tuple[str, ...]) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """
+    Compila (uma vez por combinação de filtros presentes) os fragmentos de
+    WHERE sobre beneficiario e a ordem dos binds. O schema é estático entre
+    restarts, então o resultado pode ser memoizado por forma — a resolução de
+    coluna sai do caminho quente e vira um lookup de dict.
+    """
+    with con_ro() as c:
+        cols = set(table_columns(c, "beneficiario"))
+    frags: List[str] = []
+    ordem: List[str] = []
+    for k in keys:
+        for cand in BENEF_FILTER_COLS[k]:
+            if cand in cols:
+                frags.append(f"upper(b.{cand}) = upper(?)")
+                ordem.append(k)
+                break
+    return tuple(frags), tuple(ordem)
+
+# -----------------------
+# Versão dos dados / ETag
+# -----------------------
+# O banco é read-only e a ingestão é em lote (load_data.py). Enquanto os dados
+# não mudam, a resposta de um KPI para os mesmos parâmetros é sempre a mesma —
+# então dá para responder 304 sem executar a consulta pesada.
+DATA_VERSION_TTL = int(os.getenv("DATA_VERSION_TTL", "300"))  # segundos
+_data_version: Optional[str] = None
+_data_version_ts: float = 0.0
+
+def data_version() -> str:
+    """Fingerprint barato do estado do banco (última competência + nº de linhas)."""
+    global _data_version, _data_version_ts
+    now = time.time()
+    if _data_version is None or (now - _data_version_ts) > DATA_VERSION_TTL:
+        try:
+            with con_ro() as c:
+                comp = latest_competencia(c)
+                (n,) = c.execute("SELECT COUNT(*) FROM conta").fetchone()
+            _data_version = f"{comp}:{n}"
+        except Exception:
+            _data_version = "indisponivel"
+        _data_version_ts = now
+    return _data_version
+
+# Cache de respostas prontas (JSON já serializado) por path+query: um
+# dashboard que consulta os mesmos KPIs a cada poucos segundos nem chega a
+# tocar o DuckDB dentro da janela de TTL. Dict simples com expiração por
+# entrada — sem dependência de cachetools.
+RESP_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+# Competência encerrada é imutável até a próxima carga: TTL bem mais longo,
+# ajustável por env (a carga invalida tudo via /admin/schema_reload mesmo).
+RESP_CACHE_TTL_FECHADO = float(os.getenv("RESPONSE_CACHE_TTL_FECHADO", "86400"))
+RESP_CACHE_MAX = 1024
+_resp_cache: Dict[str, Tuple[float, bytes, str]] = {}
+
+def invalidate_response_cache() -> None:
+    _resp_cache.clear()
+
+def mes_fechado(request: Request) -> bool:
+    """
+    True se a requisição referencia só competências já encerradas (mês
+    estritamente anterior ao atual): o resultado é imutável e pode ficar em
+    cache bem mais tempo, tanto aqui quanto num proxy reverso.
+    """
+    comp = request.query_params.get("competencia") or request.query_params.get("ate")
+    if not comp or not re.fullmatch(r"\d{4}-\d{2}", comp):
+        return False
+    return comp < time.strftime("%Y-%m")
+
+@app.middleware("http")
+async def kpi_etag_middleware(request: Request, call_next):
+    # Só GETs de KPI; demais rotas passam direto.
+    if request.method != "GET" or not request.url.path.startswith("/kpi/"):
+        return await call_next(request)
+    # ?stream=1 não passa pelo cache/ETag: bufferizar o corpo aqui anularia
+    # o streaming.
+    if request.query_params.get("stream") in ("1", "true"):
+        return await call_next(request)
+
+    rota = f"{request.url.path}?{request.url.query}"
+    chave = f"{data_version()}|{rota}"
+    etag = 'W/"' + hashlib.md5(chave.encode()).hexdigest() + '"'
+    fechado = mes_fechado(request)
+    max_age = int(min(RESP_CACHE_TTL_FECHADO, 31536000)) if fechado else 300
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    # A chave inclui o fingerprint dos dados: depois de um load_data.py o
+    # fingerprint muda e as entradas antigas simplesmente deixam de casar,
+    # mesmo dentro do TTL.
+    hit = _resp_cache.get(chave)
+    if hit is not None and hit[0] > time.time():
+        return Response(content=hit[1], media_type=hit[2], headers=headers)
+
+    response = await call_next(request)
+    if response.status_code != 200:
+        return response
+
+    corpo = b"".join([chunk async for chunk in response.body_iterator])
+    if len(_resp_cache) >= RESP_CACHE_MAX:
+        _resp_cache.clear()
+    media = response.media_type or "application/json"
+    ttl = RESP_CACHE_TTL_FECHADO if fechado else RESP_CACHE_TTL
+    _resp_cache[chave] = (time.time() + ttl, corpo, media)
+    return Response(content=corpo, media_type=media, headers=headers)
+
+@app.on_event("startup")
+def abrir_conexao():
+    # Abre (e configura) a conexão compartilhada já na subida do processo,
+    # em vez de pagar open + catálogo na primeira requisição.
+    try:
+        con_ro().close()
+    except HTTPException:
+        # Banco ainda não carregado: os endpoints respondem 503 até o
+        # load_data.py rodar; a raiz e /docs continuam de pé.
+        pass
+
+@app.on_event("startup")
+def prewarm():
+    # Aquece tudo que a primeira requisição real pagaria a frio: snapshot de
+    # schema, templates SQL memoizados e as páginas de dados dos KPIs mais
+    # comuns (o DuckDB carrega os row groups tocados no buffer pool).
+    # Best-effort: qualquer falha aqui não pode impedir a subida.
+    try:
+        with con_ro() as c:
+            _schema_snapshot()
+            c.execute(cached_sql("health")).fetchall()
+            c.execute(cached_sql("sin_media"), [12]).fetchall()
+            comp = latest_competencia(c)
+            sum_sinistro_e_premio(c, comp)
+    except Exception:
+        pass
 
 # -------------
 # Endpoints
@@ -105,31 +524,120 @@ def root():
             "/health",
             "/kpi/sinistralidade/ultima",
             "/kpi/sinistralidade/competencia?competencia=YYYY-MM",
+            "/kpi/sinistralidade/media?meses=12",
+            "/kpi/sinistralidade/tendencia?meses=3",
+            "/kpi/sinistralidade/ativos",
+            "/kpi/sinistralidade/por_produto",
+            "/kpi/sinistralidade/por_cidade",
+            "/kpi/sinistralidade/por_faixa",
             "/kpi/prestador/top?competencia=YYYY-MM&limite=10",
             "/kpi/prestador/impacto?competencia=YYYY-MM&top=10",
             "/kpi/utilizacao/resumo?competencia=YYYY-MM",
+            "/kpi/utilizacao/evolucao?desde=YYYY-MM&ate=YYYY-MM",
+            "/meta/sample?tabela=conta&limite=5",
+            "/meta/meses?tabela=conta",
+            "/meta/schema",
         ],
     }
 
 @app.get("/health")
 def health():
+    # Contagens de todas as tabelas presentes numa única query UNION ALL
+    # (texto montado a partir do catálogo conhecido e cacheado por processo);
+    # tabela ausente vira null sem nenhum SQL.
+    contagens: Dict[str, int] = {}
+    try:
+        with con_ro() as c:
+            contagens = {t: int(n) for t, n in c.execute(cached_sql("health")).fetchall()}
+    except Exception:
+        pass
+    resp: Dict[str, object] = {"ok": True, "db": DB_PATH}
+    for t in TABELAS_BASE:
+        resp[f"{t}_rows"] = contagens.get(t)
+    return resp
+
+@app.post("/admin/schema_reload")
+def schema_reload():
+    # Para usar depois de recarregar os dados com load_data.py
+    invalidate_schema_cache()
+    invalidate_response_cache()
+    return {"ok": True, "message": "Caches de schema e de respostas limpos."}
+
+@app.post("/admin/cache_invalidate")
+def cache_invalidate():
+    # Limpa só o cache de respostas (os TTLs longos de mês fechado incluídos),
+    # sem jogar fora o snapshot de schema nem os templates SQL.
+    invalidate_response_cache()
+    return {"ok": True, "message": "Cache de respostas limpo."}
+
+@app.get("/meta/sample")
+def meta_sample(
+    tabela: str = Query(..., description="Nome da tabela"),
+    limite: int = Query(5, ge=1, le=10000),
+):
+    tabela = _safe_table(tabela)
+
+    # Resposta em streaming: as linhas saem em lotes de 1024 conforme o
+    # cursor entrega, então o pico de memória é O(lote) e não O(limite) —
+    # importante agora que o teto subiu para 10 mil linhas. O JSON mantém o
+    # mesmo formato de antes ({tabela, colunas, linhas}).
+    def gerar():
+        with con_ro() as c:
+            cur = c.execute(f'SELECT * FROM "{tabela}" LIMIT ?', [limite])
+            nomes = [d[0] for d in cur.description]
+            yield b'{"tabela":' + orjson.dumps(tabela) + b',"colunas":' + orjson.dumps(nomes) + b',"linhas":['
+            primeira = True
+            while True:
+                lote = cur.fetchmany(1024)
+                if not lote:
+                    break
+                for r in lote:
+                    if not primeira:
+                        yield b","
+                    primeira = False
+                    yield orjson.dumps(dict(zip(nomes, r)), default=str)
+            yield b"]}"
+
+    return StreamingResponse(gerar(), media_type="application/json")
+
+@app.get("/meta/schema")
+def meta_schema():
+    # Servido direto do snapshot memoizado do catálogo — zero SQL por request.
+    return {"tabelas": {t: list(cols) for t, cols in sorted(_schema_snapshot().items())}}
+
+@lru_cache(maxsize=128)
+def _meses_da_tabela(tabela: str, limite: int) -> Tuple[str, ...]:
+    # Dados históricos não mudam entre cargas: o dropdown de meses do
+    # dashboard vira um lookup memoizado; /admin/schema_reload descarta.
     with con_ro() as c:
-        # Apenas verifica acesso e contagem simples
-        try:
-            (n_conta,) = c.execute("SELECT COUNT(*) FROM conta").fetchone()
-        except Exception:
-            n_conta = None
-        try:
-            (n_mens,), = [(c.execute("SELECT COUNT(*) FROM mensalidade").fetchone())]
-        except Exception:
-            n_mens = None
-        return {"ok": True, "db": DB_PATH, "conta_rows": n_conta, "mensalidade_rows": n_mens}
+        # Identificadores só entram no SQL depois de validados contra o
+        # catálogo (tabela no chamador, coluna via pick_col); o LIMIT vai
+        # por bind, então o texto da query é estável por tabela.
+        expr = month_expr_sql(c, tabela, CAND_MES_GENERICO)
+        rows = c.execute(
+            f'SELECT DISTINCT {expr} AS mes FROM "{tabela}" '
+            f"WHERE {expr} IS NOT NULL ORDER BY mes DESC LIMIT ?",
+            [limite],
+        ).fetchall()
+    return tuple(r[0] for r in rows)
+
+@app.get("/meta/meses")
+def meta_meses(
+    tabela: str = Query("conta", description="Tabela com coluna de competência/data"),
+    limite: int = Query(24, ge=1, le=240),
+):
+    tabela = _safe_table(tabela)
+    return {"tabela": tabela, "meses": list(_meses_da_tabela(tabela, limite))}
 
 @app.get("/kpi/sinistralidade/ultima")
 def sinistralidade_ultima():
     with con_ro() as c:
-        comp = latest_competencia(c)
-        sinistro, premio = sum_sinistro_e_premio(c, comp)
+        mv = sinistralidade_mv(c, None)
+        if mv is not None:
+            comp, sinistro, premio = mv
+        else:
+            comp = latest_competencia(c)
+            sinistro, premio = sum_sinistro_e_premio(c, comp)
         sin = (sinistro / premio) if premio else 0.0
         return {
             "competencia": comp,
@@ -140,10 +648,14 @@ def sinistralidade_ultima():
 
 @app.get("/kpi/sinistralidade/competencia")
 def sinistralidade_competencia(
-    competencia: str = Query(..., pattern=r"^\d{4}-\d{2}$", description="YYYY-MM")
+    competencia: str = competencia_query()
 ):
     with con_ro() as c:
-        sinistro, premio = sum_sinistro_e_premio(c, competencia)
+        mv = sinistralidade_mv(c, competencia)
+        if mv is not None:
+            _, sinistro, premio = mv
+        else:
+            sinistro, premio = sum_sinistro_e_premio(c, competencia)
         sin = (sinistro / premio) if premio else 0.0
         return {
             "competencia": competencia,
@@ -152,152 +664,586 @@ def sinistralidade_competencia(
             "sinistralidade": sin,
         }
 
+@app.get("/kpi/sinistralidade/media")
+def sinistralidade_media(
+    meses: int = Query(12, ge=1, le=120, description="Quantidade de competências mais recentes")
+):
+    with con_ro() as c:
+        # Totais e razão por linha calculados no próprio DuckDB (janela sobre o
+        # conjunto já limitado); o Python só lê escalares pré-agregados.
+        # fetchnumpy() entrega os buffers colunares direto ao NumPy, sem
+        # materializar tuplas Python linha a linha.
+        cols = c.execute(cached_sql("sin_media"), [meses]).fetchnumpy()
+    mes_arr = cols["mes"]
+    custo_arr = np.nan_to_num(np.asarray(cols["custo"], dtype=float))
+    receita_arr = np.nan_to_num(np.asarray(cols["receita"], dtype=float))
+    sin_arr = np.nan_to_num(np.asarray(cols["sinistralidade"], dtype=float))
+    total_custo = float(cols["custo_total"][0]) if len(mes_arr) else 0.0
+    total_receita = float(cols["receita_total"][0]) if len(mes_arr) else 0.0
+    serie = [
+        {
+            "competencia": str(m),
+            "sinistro": float(cu),
+            "receita": float(re_),
+            "sinistralidade": float(s),
+        }
+        for m, cu, re_, s in zip(mes_arr, custo_arr, receita_arr, sin_arr)
+    ]
+    serie.reverse()  # fetch veio DESC; resposta em ordem cronológica
+    return {
+        "meses": len(serie),
+        "sinistro_total": total_custo,
+        "receita_total": total_receita,
+        "sinistralidade_media": (total_custo / total_receita) if total_receita else 0.0,
+        "serie": serie,
+    }
+
+@lru_cache(maxsize=8)
+def sin_por_dim_sql(dim_expr: str, ordem_chave: bool = False) -> str:
+    """
+    SQL de sinistralidade por dimensão do beneficiário (chave, custo, receita,
+    razão) numa competência: custo (conta) e receita (mensalidade) agregados em
+    CTEs e fundidos num único FULL OUTER JOIN, com ordenação e LIMIT já no SQL
+    — uma ida ao banco por requisição, sem merge de dicts em Python.
+    """
+    with con_ro() as c:
+        vl_lib = pick_col(c, "conta", CAND_VL_CONTA)
+        vl_pre = pick_col(c, "mensalidade", CAND_VL_MENSALIDADE)
+        # A expressão de dimensão (ex.: CASE de faixa etária sobre a idade) é
+        # avaliada UMA vez por beneficiário na CTE dim e reaproveitada pelos
+        # dois lados do join, em vez de recomputada em custos e em receitas.
+        return f"""
+            WITH dim AS (
+              SELECT b.id_beneficiario, {dim_expr} AS chave FROM beneficiario b
+            ), custos AS (
+              SELECT d.chave, SUM(ct.{vl_lib}) AS custo
+              FROM (
+                SELECT id_beneficiario, {vl_lib} FROM conta WHERE {conta_mes_expr(c)} = ?
+              ) ct JOIN dim d USING (id_beneficiario)
+              GROUP BY 1
+            ), receitas AS (
+              SELECT d.chave, SUM(m.{vl_pre}) AS receita
+              FROM (
+                SELECT id_beneficiario, {vl_pre} FROM mensalidade WHERE {mensalidade_mes_expr(c)} = ?
+              ) m JOIN dim d USING (id_beneficiario)
+              GROUP BY 1
+            )
+            SELECT chave,
+                   COALESCE(custo, 0) AS custo,
+                   COALESCE(receita, 0) AS receita,
+                   CASE WHEN COALESCE(receita, 0) <> 0
+                        THEN COALESCE(custo, 0) / receita END AS sinistralidade
+            FROM custos FULL OUTER JOIN receitas USING (chave)
+            WHERE chave IS NOT NULL
+            ORDER BY {"chave" if ordem_chave else "sinistralidade DESC NULLS LAST"}
+            LIMIT ?
+        """
+
+def sinistralidade_por_dimensao(
+    dim_expr: str,
+    rotulo: str,
+    competencia: Optional[str],
+    limite: int,
+    ordem_chave: bool = False,
+    rollup: Optional[str] = None,
+    stream: bool = False,
+):
+    with con_ro() as c:
+        comp = competencia or latest_competencia(c)
+        # Rollup pré-agregado na carga (load_data.py): WHERE competencia = ?
+        # sobre milhares de linhas em vez do join conta/mensalidade ao vivo.
+        if rollup and table_exists(c, rollup) and {
+            "competencia", "chave", "custo", "receita", "sinistralidade"
+        } <= set(table_columns(c, rollup)):
+            ordem = "chave" if ordem_chave else "sinistralidade DESC NULLS LAST"
+            rows = c.execute(
+                f"SELECT chave, custo, receita, sinistralidade FROM {rollup} "
+                f"WHERE competencia = ? ORDER BY {ordem} LIMIT ?",
+                [comp, limite],
+            ).fetchall()
+        else:
+            rows = c.execute(sin_por_dim_sql(dim_expr, ordem_chave), [comp, comp, limite]).fetchall()
+    itens = [
+        {rotulo: ch, "sinistro": float(cu), "receita": float(re_), "sinistralidade": sin}
+        for ch, cu, re_, sin in rows
+    ]
+    if stream:
+        return ndjson_stream(itens)
+    return {"competencia": comp, "itens": itens}
+
+CAND_STATUS_BENEF = ("ds_situacao", "ds_status", "st_situacao")
+
+@app.get("/kpi/sinistralidade/ativos")
+def sinistralidade_ativos(
+    competencia: Optional[str] = competencia_query(obrigatoria=False),
+):
+    # Sinistralidade só dos beneficiários ativos: o conjunto ativo sai como
+    # CTE e os dois SUMs (conta e mensalidade) são fundidos na mesma query —
+    # um round trip, um filtro de beneficiario compartilhado.
+    with con_ro() as c:
+        # Flag materializada na carga quando existe; em banco antigo, o
+        # predicado de texto por linha de sempre.
+        if "is_ativo" in set(table_columns(c, "beneficiario")):
+            cond_ativo = "is_ativo"
+        else:
+            status_col = pick_col(c, "beneficiario", CAND_STATUS_BENEF)  # 400 se não houver
+            cond_ativo = f"upper({status_col}) LIKE 'ATIV%'"
+        vl_lib = pick_col(c, "conta", CAND_VL_CONTA)
+        vl_pre = pick_col(c, "mensalidade", CAND_VL_MENSALIDADE)
+        comp = competencia or latest_competencia(c)
+        sinistro, receita, n_ativos = c.execute(
+            f"""
+            WITH ativos AS (
+              SELECT id_beneficiario FROM beneficiario
+              WHERE {cond_ativo}
+            ), custos AS (
+              SELECT COALESCE(SUM(ct.{vl_lib}), 0) AS custo
+              FROM (
+                SELECT id_beneficiario, {vl_lib} FROM conta WHERE {conta_mes_expr(c)} = ?
+              ) ct JOIN ativos USING (id_beneficiario)
+            ), receitas AS (
+              SELECT COALESCE(SUM(m.{vl_pre}), 0) AS receita
+              FROM (
+                SELECT id_beneficiario, {vl_pre} FROM mensalidade WHERE {mensalidade_mes_expr(c)} = ?
+              ) m JOIN ativos USING (id_beneficiario)
+            )
+            SELECT custos.custo, receitas.receita, (SELECT COUNT(*) FROM ativos)
+            FROM custos, receitas
+            """,
+            [comp, comp],
+        ).fetchone()
+    sinistro, receita = float(sinistro or 0.0), float(receita or 0.0)
+    return {
+        "competencia": comp,
+        "beneficiarios_ativos": int(n_ativos),
+        "sinistro": sinistro,
+        "receita": receita,
+        "sinistralidade": (sinistro / receita) if receita else 0.0,
+    }
+
+@app.get("/kpi/sinistralidade/tendencia")
+def sinistralidade_tendencia(
+    meses: int = Query(3, ge=2, le=12, description="Janela de competências mais recentes")
+):
+    # Reusa o template da série (kpi_sinistralidade_mensal quando existe):
+    # uma query de N linhas; a classificação roda em Python sobre ≤12 itens.
+    with con_ro() as c:
+        rows = c.execute(cached_sql("sin_serie"), [meses]).fetchall()
+    serie = [
+        {
+            "competencia": m,
+            "sinistro": float(cu or 0.0),
+            "receita": float(re_ or 0.0),
+            "sinistralidade": (float(cu or 0.0) / float(re_)) if re_ else 0.0,
+        }
+        for m, cu, re_ in rows
+    ]
+    serie.reverse()  # fetch veio DESC; resposta em ordem cronológica
+    if len(serie) < 2:
+        tendencia, variacao = "indefinida", None
+    else:
+        variacao = serie[-1]["sinistralidade"] - serie[0]["sinistralidade"]
+        if variacao > 0.005:
+            tendencia = "alta"
+        elif variacao < -0.005:
+            tendencia = "queda"
+        else:
+            tendencia = "estavel"
+    return {"meses": len(serie), "tendencia": tendencia, "variacao": variacao, "serie": serie}
+
+@app.get("/kpi/sinistralidade/por_produto")
+def sinistralidade_por_produto(
+    competencia: Optional[str] = competencia_query(obrigatoria=False),
+    limite: int = Query(10, ge=1, le=100),
+    stream: bool = Query(False, description="Responde NDJSON (uma linha por item)"),
+):
+    with con_ro() as c:
+        col = pick_col(c, "beneficiario", BENEF_FILTER_COLS["produto"])
+    return sinistralidade_por_dimensao(
+        f"b.{col}", "produto", competencia, limite, rollup="rollup_sin_produto", stream=stream
+    )
+
+@app.get("/kpi/sinistralidade/por_cidade")
+def sinistralidade_por_cidade(
+    competencia: Optional[str] = competencia_query(obrigatoria=False),
+    limite: int = Query(10, ge=1, le=100),
+    stream: bool = Query(False, description="Responde NDJSON (uma linha por item)"),
+):
+    with con_ro() as c:
+        col = pick_col(c, "beneficiario", BENEF_FILTER_COLS["cidade"])
+    return sinistralidade_por_dimensao(
+        f"b.{col}", "cidade", competencia, limite, rollup="rollup_sin_cidade", stream=stream
+    )
+
+@app.get("/kpi/sinistralidade/por_faixa")
+def sinistralidade_por_faixa(
+    competencia: Optional[str] = competencia_query(obrigatoria=False),
+    limite: int = Query(10, ge=1, le=100),
+    bins: str = Query(BINS_PADRAO, description="Faixas 'NN-NN' ou 'NN+' separadas por vírgula"),
+):
+    with con_ro() as c:
+        cols_benef = set(table_columns(c, "beneficiario"))
+        if "idade" in cols_benef:
+            idade = "b.idade"
+        else:
+            dt_nasc = pick_col(c, "beneficiario", ("dt_nascimento",))
+            idade = f"date_diff('year', TRY_CAST(b.{dt_nasc} AS DATE), CURRENT_DATE)"
+    if bins == BINS_PADRAO and "faixa_etaria" in cols_benef:
+        faixa = "b.faixa_etaria"  # rótulo pré-computado na carga
+    else:
+        faixa = faixa_case_sql(bins, idade)
+    # Faixas voltam na ordem natural, não por razão; o rollup da carga só
+    # cobre as faixas padrão — bins customizados caem no caminho ao vivo.
+    return sinistralidade_por_dimensao(
+        faixa, "faixa", competencia, limite, ordem_chave=True,
+        rollup="rollup_sin_faixa" if bins == BINS_PADRAO else None,
+    )
+
 @app.get("/kpi/prestador/top")
 def prestador_top(
-    competencia: str = Query(..., pattern=r"^\d{4}-\d{2}$", description="YYYY-MM"),
+    competencia: str = competencia_query(),
     limite: int = Query(10, ge=1, le=100),
 ):
     with con_ro() as c:
-        conta_mes_col = pick_col(c, "conta", ["dt_competencia", "dt_mes_competencia"])
-        vl_lib = pick_col(c, "conta", ["vl_liberado"])
+        vl_lib = pick_col(c, "conta", CAND_VL_CONTA)
+        prest_col = pick_col(c, "conta", CAND_PRESTADOR_CONTA)
         nm_col = prestador_nome_col(c)
 
-        rows = c.execute(
+        # Agrega e corta o top-N ANTES do join: o LEFT JOIN com prestador
+        # recebe no máximo `limite` linhas (lookup de nomes), em vez de todos
+        # os prestadores do mês entrando no hash join para depois descartar.
+        # fetchnumpy() entrega os buffers colunares direto; a conversão de
+        # float acontece em C, sem box de PyFloat linha a linha.
+        cols = c.execute(
             f"""
-            SELECT c.id_prestador,
-                   COALESCE(p.{nm_col}, CAST(c.id_prestador AS VARCHAR)) AS nome,
-                   SUM(c.{vl_lib}) AS score
-            FROM conta c
-            LEFT JOIN prestador p USING (id_prestador)
-            WHERE {conta_mes_col} = ?
-            GROUP BY 1,2
-            ORDER BY score DESC
-            LIMIT ?
+            SELECT t.id_prestador,
+                   COALESCE(p.{nm_col}, CAST(t.id_prestador AS VARCHAR)) AS nome,
+                   t.score
+            FROM (
+              SELECT {prest_col} AS id_prestador, SUM({vl_lib}) AS score
+              FROM conta WHERE {conta_mes_expr(c)} = ?
+              GROUP BY 1
+              ORDER BY score DESC
+              LIMIT ?
+            ) t
+            LEFT JOIN prestador p ON p.id_prestador = t.id_prestador
+            ORDER BY t.score DESC
             """,
             [competencia, limite],
-        ).fetchall()
+        ).fetchnumpy()
 
+        scores = np.nan_to_num(np.asarray(cols["score"], dtype=float))
         return {
             "competencia": competencia,
-            "top": [{"id_prestador": r[0], "nome": r[1], "score": float(r[2] or 0.0)} for r in rows],
+            "top": [
+                {"id_prestador": int(i), "nome": str(n), "score": float(s)}
+                for i, n, s in zip(cols["id_prestador"], cols["nome"], scores)
+            ],
         }
 
 @app.get("/kpi/prestador/impacto")
 def prestador_impacto(
-    competencia: str = Query(..., pattern=r"^\d{4}-\d{2}$", description="YYYY-MM"),
+    competencia: str = competencia_query(),
     top: int = Query(10, ge=1, le=100),
 ):
     with con_ro() as c:
-        conta_mes_col = pick_col(c, "conta", ["dt_competencia", "dt_mes_competencia"])
-        vl_lib = pick_col(c, "conta", ["vl_liberado"])
+        vl_lib = pick_col(c, "conta", CAND_VL_CONTA)
+        prest_col = pick_col(c, "conta", CAND_PRESTADOR_CONTA)
         nm_col = prestador_nome_col(c)
 
-        (total_mes,) = c.execute(
-            f"SELECT COALESCE(SUM({vl_lib}),0) FROM conta WHERE {conta_mes_col} = ?",
-            [competencia],
-        ).fetchone()
-
-        rows = c.execute(
+        # Uma query só: agrega o mês por prestador, tira o total como CTE
+        # escalar (CROSS JOIN) e calcula a participação vetorizada no próprio
+        # DuckDB — o scan filtrado de conta é compartilhado entre custo e total.
+        cols = c.execute(
             f"""
-            SELECT c.id_prestador,
-                   COALESCE(p.{nm_col}, CAST(c.id_prestador AS VARCHAR)) AS nome,
-                   SUM(c.{vl_lib}) AS custo
-            FROM conta c
-            LEFT JOIN prestador p USING (id_prestador)
-            WHERE {conta_mes_col} = ?
-            GROUP BY 1,2
-            ORDER BY custo DESC
+            WITH fil AS (
+              SELECT {prest_col} AS id_prestador, {vl_lib} AS v
+              FROM conta WHERE {conta_mes_expr(c)} = ?
+            ), agg AS (
+              SELECT id_prestador, SUM(v) AS custo FROM fil GROUP BY 1
+            ), tot AS (
+              SELECT COALESCE(SUM(custo), 0) AS total FROM agg
+            )
+            SELECT a.id_prestador,
+                   COALESCE(p.{nm_col}, CAST(a.id_prestador AS VARCHAR)) AS nome,
+                   a.custo,
+                   CASE WHEN t.total <> 0 THEN a.custo / t.total ELSE 0 END AS participacao,
+                   t.total
+            FROM agg a
+            CROSS JOIN tot t
+            LEFT JOIN prestador p ON p.id_prestador = a.id_prestador
+            ORDER BY a.custo DESC
             LIMIT ?
             """,
             [competencia, top],
+        ).fetchnumpy()
+
+        custos = np.nan_to_num(np.asarray(cols["custo"], dtype=float))
+        partes = np.nan_to_num(np.asarray(cols["participacao"], dtype=float))
+        total_mes = float(cols["total"][0]) if len(custos) else 0.0
+        dados = [
+            {"id_prestador": int(i), "nome": str(n), "custo": float(cu), "participacao": float(pc)}
+            for i, n, cu, pc in zip(cols["id_prestador"], cols["nome"], custos, partes)
+        ]
+
+        return {"competencia": competencia, "total_mes": total_mes, "dados": dados}
+
+@lru_cache(maxsize=4)
+def evolucao_sql(exato: bool) -> str:
+    """
+    Query da evolução, montada uma vez por forma (exato/aproximado): uma
+    única agregação para o intervalo inteiro, com calendário via
+    generate_series e zero-fill no LEFT JOIN — tudo dentro do DuckDB.
+    Parâmetros: [desde-01, ate-01, desde, ate].
+    """
+    with con_ro() as c:
+        if table_exists(c, "fact_benef_mes"):
+            # Fato (mes, beneficiário) já deduplicado na carga: contagem
+            # distinta vira COUNT(*) puro, exata e sem hash set.
+            fonte, mes_expr, distinto = "fact_benef_mes", "mes", "COUNT(*)"
+        elif table_exists(c, "mv_autorizacao_mensal"):
+            fonte, mes_expr, distinto = "mv_autorizacao_mensal", "mes", None
+        else:
+            fonte = "autorizacao"
+            mes_expr = autorizacao_mes_expr(c)
+            distinto = None
+    if distinto is None:
+        # approx_count_distinct (HyperLogLog) por padrão: erro de ~1-2% é
+        # aceitável para dashboard e evita montar um hash set por mês.
+        distinto = "COUNT(DISTINCT id_beneficiario)" if exato else "approx_count_distinct(id_beneficiario)"
+    return f"""
+        SELECT s.mes, COALESCE(agg.n, 0) AS n
+        FROM (
+            SELECT strftime(d, '%Y-%m') AS mes
+            FROM generate_series(CAST(? AS DATE), CAST(? AS DATE), INTERVAL 1 MONTH) t(d)
+        ) s
+        LEFT JOIN (
+            SELECT {mes_expr} AS mes, {distinto} AS n
+            FROM {fonte}
+            WHERE {mes_expr} BETWEEN ? AND ?
+            GROUP BY 1
+        ) agg USING (mes)
+        ORDER BY s.mes
+    """
+
+def ndjson_stream(itens) -> StreamingResponse:
+    # Uma linha JSON por item (NDJSON): o envio começa antes de a lista
+    # inteira existir em memória. Opt-in via ?stream=1 nas séries grandes.
+    def gerar():
+        for item in itens:
+            yield orjson.dumps(item, default=str) + b"\n"
+    return StreamingResponse(gerar(), media_type="application/x-ndjson")
+
+@app.get("/kpi/utilizacao/evolucao")
+def utilizacao_evolucao(
+    desde: str = competencia_query(),
+    ate: str = competencia_query(),
+    exato: bool = Query(False, description="Contagem distinta exata (mais cara) em vez de aproximada"),
+    stream: bool = Query(False, description="Responde NDJSON (uma linha por mês)"),
+):
+    if desde > ate:
+        raise HTTPException(status_code=400, detail="'desde' deve ser <= 'ate'.")
+
+    ano, mes = map(int, desde.split("-"))
+    ano_fim, mes_fim = map(int, ate.split("-"))
+    if (ano_fim - ano) * 12 + (mes_fim - mes) + 1 > 120:
+        raise HTTPException(status_code=400, detail="Intervalo máximo de 120 meses.")
+
+    with con_ro() as c:
+        usa_fact = table_exists(c, "fact_benef_mes")
+        rows = c.execute(
+            evolucao_sql(exato), [f"{desde}-01", f"{ate}-01", desde, ate]
         ).fetchall()
 
-        dados = []
-        for r in rows:
-            custo = float(r[2] or 0.0)
-            perc = (custo / total_mes) if total_mes else 0.0
-            dados.append({"id_prestador": r[0], "nome": r[1], "custo": custo, "participacao": perc})
+    serie = [{"mes": r[0], "beneficiarios_utilizados": int(r[1] or 0)} for r in rows]
+    if stream:
+        return ndjson_stream(serie)
+    metodo = "exato" if (exato or usa_fact) else "approx"
+    return {"desde": desde, "ate": ate, "metodo": metodo, "serie": serie}
+
+class ResumoCols(NamedTuple):
+    usa_mv: bool
+    fonte: str
+    filtro_mes: str
+    col_prod_conta: Optional[str]
+    benef_tem_dt_nasc: bool
+    benef_tem_idade: bool
 
-        return {"competencia": competencia, "total_mes": float(total_mes or 0.0), "dados": dados}
+@lru_cache(maxsize=1)
+def resumo_cols() -> ResumoCols:
+    # Resolve de uma vez tudo que o resumo precisa saber do schema; cada
+    # requisição lê o struct pronto em vez de repetir as mesmas consultas
+    # de colunas.
+    with con_ro() as c:
+        usa_mv = table_exists(c, "mv_autorizacao_mensal")
+        if usa_mv:
+            fonte, filtro_mes = "mv_autorizacao_mensal", "a.mes = ?"
+        else:
+            fonte = "autorizacao"
+            filtro_mes = f"{autorizacao_mes_expr(c, 'a')} = ?"
+        cols_conta = set(table_columns(c, "conta"))
+        col_prod = next((x for x in ("produto", "ds_produto") if x in cols_conta), None)
+        if "id_beneficiario" not in cols_conta:
+            col_prod = None
+        cols_benef = set(table_columns(c, "beneficiario"))
+        benef_tem_dt_nasc = "dt_nascimento" in cols_benef
+        benef_tem_idade = "idade" in cols_benef
+    return ResumoCols(usa_mv, fonte, filtro_mes, col_prod, benef_tem_dt_nasc, benef_tem_idade)
+
+@lru_cache(maxsize=64)
+def resumo_sql(presentes: Tuple[str, ...], faixa_modo: str, produto_exists: bool, exato: bool) -> str:
+    """
+    SQL final do resumo, memoizado pela ASSINATURA dos filtros (quais estão
+    presentes e em que forma) — os valores entram por bind, então o mesmo
+    texto serve para qualquer combinação de valores. O espaço de assinaturas
+    é pequeno e fechado, daí o lru_cache limitado.
+    """
+    rc = resumo_cols()
+    frags, _ = compile_benef_filters(presentes)
+
+    # Filtros que enxergam só a tabela de autorizações (lado 'a') ficam
+    # separados dos que precisam de colunas do beneficiário (lado 'b'):
+    # os primeiros entram antes da deduplicação, os segundos depois.
+    filtros_a: List[str] = [rc.filtro_mes]
+    filtros_b: List[str] = list(frags)
+
+    # Sem coluna de faixa no beneficiário: faixa etária sobre a coluna
+    # 'idade' materializada na carga (range inteiro, zone maps) ou, em banco
+    # antigo, calculada sobre dt_nascimento.
+    if rc.benef_tem_idade:
+        idade_expr = "b.idade"
+    else:
+        idade_expr = "date_diff('year', CAST(b.dt_nascimento AS DATE), CURRENT_DATE)"
+    if faixa_modo == "minimo":
+        filtros_b.append(f"{idade_expr} >= ?")
+    elif faixa_modo == "intervalo":
+        filtros_b.append(f"{idade_expr} BETWEEN ? AND ?")
+
+    # Produto fora do beneficiário: semi-join (EXISTS) em conta. Um LEFT JOIN
+    # com filtro no lado direito viraria inner join e ainda multiplicaria
+    # linhas pelo fan-out 1-N de conta, inflando o DISTINCT.
+    if produto_exists:
+        filtros_a.append(
+            f"EXISTS (SELECT 1 FROM conta ct "
+            f"WHERE ct.id_beneficiario = a.id_beneficiario "
+            f"AND upper(ct.{rc.col_prod_conta}) = upper(?))"
+        )
+
+    # Base total como subconsulta escalar: a requisição inteira é UMA ida ao
+    # DuckDB (o COUNT(*) de beneficiario sai das estatísticas, sem scan).
+    base_sql = "(SELECT COUNT(*) FROM beneficiario) AS base"
+    qt_expr = "SUM(a.n)" if rc.usa_mv else "COUNT(*)"
+
+    if filtros_b:
+        # Deduplica por beneficiário ANTES do join: o GROUP BY roda sobre o
+        # conjunto menor (só autorizações do mês) e o join com beneficiario
+        # vira 1-para-1, sem fan-out para o DISTINCT.
+        return f"""
+            SELECT {base_sql},
+                   COUNT(*) AS utilizados,
+                   COALESCE(SUM(u.n), 0) AS autorizacoes
+            FROM (
+                SELECT a.id_beneficiario, {qt_expr} AS n
+                FROM {rc.fonte} a
+                WHERE {" AND ".join(filtros_a)}
+                GROUP BY a.id_beneficiario
+            ) u
+            JOIN beneficiario b ON b.id_beneficiario = u.id_beneficiario
+            WHERE {" AND ".join(filtros_b)}
+        """
+    # Sem filtro que dependa de beneficiario: nem join é preciso.
+    distinto = (
+        "COUNT(DISTINCT a.id_beneficiario)" if exato
+        else "approx_count_distinct(a.id_beneficiario)"
+    )
+    return f"""
+        SELECT {base_sql},
+               {distinto} AS utilizados,
+               COALESCE({qt_expr}, 0) AS autorizacoes
+        FROM {rc.fonte} a
+        WHERE {" AND ".join(filtros_a)}
+    """
 
 @app.get("/kpi/utilizacao/resumo")
 def utilizacao_resumo(
-    competencia: str = Query(..., pattern=r"^\d{4}-\d{2}$", description="YYYY-MM"),
+    competencia: str = competencia_query(),
     produto: Optional[str] = Query(None),
     uf: Optional[str] = Query(None),
     cidade: Optional[str] = Query(None),
     sexo: Optional[str] = Query(None),
     faixa: Optional[str] = Query(None),
+    exato: bool = Query(False, description="Contagem distinta exata (mais cara) em vez de aproximada"),
 ):
     with con_ro() as c:
-        # Base total
-        (base_total,) = c.execute("SELECT COUNT(*) FROM beneficiario").fetchone()
+        # Colunas resolvidas uma vez por processo (resumo_cols) e SQL
+        # memoizado por assinatura de filtros (resumo_sql): o handler só
+        # calcula a assinatura e a lista de binds.
+        rc = resumo_cols()
 
-        # Coluna de data em autorizacao
-        dt_aut = autorizacao_data_col(c)
+        filtros = {"produto": produto, "uf": uf, "cidade": cidade, "sexo": sexo, "faixa": faixa}
+        presentes = tuple(k for k in BENEF_FILTER_COLS if filtros.get(k))
+        # A coluna faixa_etaria materializada só rotula as faixas padrão;
+        # faixa fora do padrão volta para o cálculo por intervalo de idade.
+        if faixa and faixa not in {r for r, _, _ in parse_bins(BINS_PADRAO)}:
+            presentes = tuple(k for k in presentes if k != "faixa")
 
-        # Monta filtros opcionais se (e somente se) existirem as colunas
-        filtros_sql = [month_filter_sql(dt_aut)]
-        params: List[object] = [competencia]
+        # Sem nenhum filtro — o caso mais comum do dashboard — o resumo sai
+        # da tabela kpi_utilizacao_mensal materializada na carga: lookup de
+        # 1 linha, contagem exata de graça.
+        if not presentes and not faixa and table_exists(c, "kpi_utilizacao_mensal"):
+            row = c.execute(
+                "SELECT beneficiarios_utilizados, autorizacoes, "
+                "(SELECT COUNT(*) FROM beneficiario) "
+                "FROM kpi_utilizacao_mensal WHERE mes = ?",
+                [competencia],
+            ).fetchone()
+            utilizados, qt_aut, base_total = row if row else (0, 0, None)
+            if base_total is None:
+                (base_total,) = c.execute("SELECT COUNT(*) FROM beneficiario").fetchone()
+            return {
+                "competencia": competencia,
+                "beneficiarios_base": int(base_total or 0),
+                "beneficiarios_utilizados": int(utilizados or 0),
+                "autorizacoes": int(qt_aut or 0),
+                "metodo": "exato",
+                "filtros_aplicados": {},
+            }
 
-        def tem_col(tab: str, col: str) -> bool:
-            return col in set(table_columns(c, tab))
+        _, ordem = compile_benef_filters(presentes)
 
-        if produto and tem_col("beneficiario", "produto"):
-            filtros_sql.append("b.produto = ?")
-            params.append(produto)
+        params_a: List[object] = [competencia]
+        params_b: List[object] = [filtros[k] for k in ordem]
 
-        if uf and tem_col("beneficiario", "uf"):
-            filtros_sql.append("b.uf = ?")
-            params.append(uf)
+        # Sem coluna de faixa no beneficiário: interpreta a faixa como faixa
+        # etária ('NN-NN' ou 'NN+') calculada sobre dt_nascimento.
+        faixa_modo = ""
+        if faixa and "faixa" not in ordem and (rc.benef_tem_idade or rc.benef_tem_dt_nasc):
+            idade_min, idade_max = parse_faixa(faixa)
+            if idade_max is None:
+                faixa_modo = "minimo"
+                params_b.append(idade_min)
+            else:
+                faixa_modo = "intervalo"
+                params_b.extend([idade_min, idade_max])
 
-        if cidade and tem_col("beneficiario", "cidade"):
-            filtros_sql.append("b.cidade = ?")
-            params.append(cidade)
+        produto_exists = bool(produto and "produto" not in ordem and rc.col_prod_conta)
+        if produto_exists:
+            params_a.append(produto)
 
-        if sexo and tem_col("beneficiario", "sexo"):
-            filtros_sql.append("b.sexo = ?")
-            params.append(sexo)
-
-        if faixa and tem_col("beneficiario", "faixa"):
-            filtros_sql.append("b.faixa = ?")
-            params.append(faixa)
-
-        where_clause = " AND ".join(filtros_sql)
-
-        # Distintos que utilizaram no mês (pelo id_beneficiario de autorizacao)
-        (utilizados,) = c.execute(
-            f"""
-            SELECT COUNT(DISTINCT a.id_beneficiario)
-            FROM autorizacao a
-            LEFT JOIN beneficiario b USING (id_beneficiario)
-            WHERE {where_clause}
-            """,
-            params,
-        ).fetchone()
-
-        # Quantidade de autorizações no mês (com os mesmos filtros)
-        (qt_autorizacoes,) = c.execute(
-            f"""
-            SELECT COUNT(*)
-            FROM autorizacao a
-            LEFT JOIN beneficiario b USING (id_beneficiario)
-            WHERE {where_clause}
-            """,
-            params,
+        (base_total, utilizados, qt_autorizacoes) = c.execute(
+            resumo_sql(presentes, faixa_modo, produto_exists, exato),
+            params_a + params_b,
         ).fetchone()
+        # Com filtro de beneficiário a forma agrupada já conta exato.
+        metodo = "exato" if (ordem or faixa_modo or exato) else "approx"
 
-        filtros_aplicados: Dict[str, str] = {}
-        if produto: filtros_aplicados["produto"] = produto
-        if uf: filtros_aplicados["uf"] = uf
-        if cidade: filtros_aplicados["cidade"] = cidade
-        if sexo: filtros_aplicados["sexo"] = sexo
-        if faixa: filtros_aplicados["faixa"] = faixa
+        filtros_aplicados: Dict[str, str] = {k: v for k, v in filtros.items() if v}
 
         return {
             "competencia": competencia,
             "beneficiarios_base": int(base_total or 0),
             "beneficiarios_utilizados": int(utilizados or 0),
             "autorizacoes": int(qt_autorizacoes or 0),
+            "metodo": metodo,
             "filtros_aplicados": filtros_aplicados,
         }
@@ -1,24 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import sys
 import duckdb
 import pandas as pd
 
+# pyarrow é opcional: com ele o fallback de encoding usa o parser C++
+# multithread do Arrow; sem ele o caminho pandas continua funcionando.
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:  # pragma: no cover
+    pa = None
+    pc = None
+    pacsv = None
+
 ROOT_DIR = Path(__file__).resolve().parent
 DATA_DIR = ROOT_DIR / "data"
 DB_PATH = DATA_DIR / "operadora.duckdb"
 
+# Tabelas carregadas dos CSVs (tabela -> arquivo em data/)
+TABELAS_CSV = (
+    ("beneficiario", "beneficiario.csv"),
+    ("conta", "conta.csv"),
+    ("mensalidade", "mensalidade.csv"),
+    ("prestador", "prestador.csv"),
+    ("autorizacao", "autorizacao.csv"),
+)
+
+# Tipos explícitos para as colunas cuja inferência é arriscada (ids que não
+# podem virar DOUBLE no meio do arquivo). Com as dicas, a amostra padrão do
+# parser basta — sem SAMPLE_SIZE=-1 varrendo o CSV inteiro só para descobrir
+# tipos antes de varrê-lo de novo para carregar.
+CSV_TYPE_HINTS: dict[str, dict[str, str]] = {
+    "beneficiario": {"id_beneficiario": "BIGINT", "id_beneficiario_titular": "BIGINT"},
+    "conta": {"id_beneficiario": "BIGINT", "id_conta": "BIGINT", "id_prestador_pagamento": "BIGINT"},
+    "mensalidade": {"id_beneficiario": "BIGINT", "id_mensalidade": "BIGINT"},
+    "prestador": {"id_prestador": "BIGINT"},
+    "autorizacao": {"id_beneficiario": "BIGINT", "id_prestador": "BIGINT", "id_autorizacao": "BIGINT"},
+}
+
+def _types_arg(table: str) -> str:
+    """Fragmento types={...} do read_csv_auto a partir das dicas da tabela."""
+    hints = CSV_TYPE_HINTS.get(table, {})
+    if not hints:
+        return ""
+    pares = ", ".join(f"'{col}': '{tipo}'" for col, tipo in hints.items())
+    return f", types={{{pares}}}"
+
+def ensure_parquet(con: duckdb.DuckDBPyConnection, table: str, csv_path: Path) -> Path | None:
+    """
+    Converte o CSV para um Parquet irmão (zstd) uma única vez. O parse de
+    texto é o custo dominante da carga; nas recargas seguintes o arquivo
+    colunar entra direto via read_parquet, ordens de grandeza mais rápido.
+    Invalidação por mtime: CSV mais novo que o Parquet força reconversão.
+    """
+    pq_path = csv_path.with_suffix(".parquet")
+    if pq_path.exists() and pq_path.stat().st_mtime >= csv_path.stat().st_mtime:
+        return pq_path
+    try:
+        caminho = str(pq_path).replace("'", "''")
+        con.execute(
+            f"""
+            COPY (SELECT * FROM read_csv_auto(?, HEADER=TRUE{_types_arg(table)}))
+            TO '{caminho}' (FORMAT PARQUET, COMPRESSION 'zstd')
+            """,
+            [str(csv_path)],
+        )
+        print(f"[OK]   {table:<12}: {pq_path.name} gerado a partir do CSV")
+        return pq_path
+    except Exception as e:
+        # CSV que o read_csv_auto não lê (ex.: encoding) segue pelo caminho
+        # normal; não deixa um Parquet parcial para trás.
+        print(f"[INFO] {table}: conversão para Parquet falhou: {type(e).__name__}")
+        pq_path.unlink(missing_ok=True)
+        return None
+
+def load_with_parquet(con: duckdb.DuckDBPyConnection, table: str, pq_path: Path) -> bool:
+    """Carrega do Parquet irmão (já tipado na conversão). True se deu certo."""
+    try:
+        con.execute(f"DROP TABLE IF EXISTS {table}")
+        con.execute(
+            f"CREATE TABLE {table} AS SELECT * FROM read_parquet(?)",
+            [str(pq_path)],
+        )
+        (cnt,) = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+        print(f"[OK]   {table:<12}: {cnt} linhas (parquet)")
+        return True
+    except Exception as e:
+        print(f"[INFO] Parquet falhou para {table} ({pq_path.name}): {type(e).__name__}: {e}")
+        return False
+
 def load_with_duckdb(con: duckdb.DuckDBPyConnection, table: str, csv_path: Path) -> bool:
     """
     Tenta carregar usando DuckDB read_csv_auto (rápido).
     Retorna True se deu certo, False se deu erro de unicode (ou erro qualquer).
     """
+    types_arg = _types_arg(table)
     try:
         con.execute(f"DROP TABLE IF EXISTS {table}")
-        # Sem ENCODING — DuckDB 1.0.0 não suporta. Mantemos HEADER e SAMPLE_SIZE.
+        # Sem ENCODING — DuckDB 1.0.0 não suporta. HEADER + dicas de tipo.
         con.execute(
             f"""
             CREATE TABLE {table} AS
-            SELECT * FROM read_csv_auto(?, HEADER=TRUE, SAMPLE_SIZE=-1, IGNORE_ERRORS=FALSE);
+            SELECT * FROM read_csv_auto(?, HEADER=TRUE, IGNORE_ERRORS=FALSE{types_arg});
             """,
             [str(csv_path)],
         )
@@ -29,6 +114,74 @@ def load_with_duckdb(con: duckdb.DuckDBPyConnection, table: str, csv_path: Path)
         print(f"[INFO] DuckDB falhou para {table} ({csv_path.name}): {type(e).__name__}: {e}")
         return False
 
+# Colunas monetárias que podem chegar como texto com decimal brasileiro
+# ('1.234,56') — no caminho Arrow elas são convertidas ainda em C++, antes de
+# entrar no banco, poupando o ALTER COLUMN do normalize_numeric.
+ARROW_MONEY_COLS: dict[str, tuple[str, ...]] = {
+    "conta": ("vl_liberado",),
+    "mensalidade": ("vl_premio",),
+}
+
+def _arrow_decimal_br(table: str, tbl: "pa.Table") -> "pa.Table":
+    """
+    Converte colunas monetárias texto -> float64 com kernels do pyarrow
+    (replace_substring + cast, vetorizados). Em qualquer dúvida a coluna fica
+    como está e o normalize_numeric resolve depois, dentro do DuckDB.
+    """
+    for col in ARROW_MONEY_COLS.get(table, ()):
+        i = tbl.schema.get_field_index(col)
+        if i < 0 or not pa.types.is_string(tbl.schema.field(i).type):
+            continue
+        try:
+            conv = pc.cast(tbl.column(i), pa.float64())
+        except Exception:
+            try:
+                limpo = pc.replace_substring(
+                    pc.replace_substring(tbl.column(i), ".", ""), ",", "."
+                )
+                conv = pc.cast(limpo, pa.float64())
+            except Exception:
+                continue
+        tbl = tbl.set_column(i, col, conv)
+        print(f"[OK]   {table:<12}: coluna '{col}' convertida para DOUBLE (arrow)")
+    return tbl
+
+def load_with_arrow(con: duckdb.DuckDBPyConnection, table: str, csv_path: Path) -> bool:
+    """
+    Fallback de encoding via pyarrow.csv: parser C++ multithread, e a tabela
+    Arrow entra no DuckDB por registro zero-copy — sem passar por objetos
+    Python linha a linha como no caminho pandas.
+    """
+    if pacsv is None:
+        return False
+    for enc in ["utf-8", "latin1", "cp1252"]:
+        try:
+            tbl = pacsv.read_csv(
+                str(csv_path),
+                read_options=pacsv.ReadOptions(encoding=enc),
+                # Campos de texto livre (observação/indicação) têm quebras de
+                # linha dentro das aspas.
+                parse_options=pacsv.ParseOptions(newlines_in_values=True),
+            )
+            # Coluna inferida como binário = texto que não decodificou neste
+            # encoding (o Arrow rebaixa para binary em vez de falhar); tenta
+            # o próximo encoding em vez de gravar BLOB no banco.
+            if any(pa.types.is_binary(f.type) or pa.types.is_large_binary(f.type)
+                   for f in tbl.schema):
+                print(f"[INFO] arrow falhou para {table} (encoding={enc}): coluna binária")
+                continue
+            tbl = _arrow_decimal_br(table, tbl)
+            con.execute(f"DROP TABLE IF EXISTS {table}")
+            con.register(f"tmp_arrow_{table}", tbl)
+            con.execute(f"CREATE TABLE {table} AS SELECT * FROM tmp_arrow_{table}")
+            con.unregister(f"tmp_arrow_{table}")
+            (cnt,) = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+            print(f"[OK]   {table:<12}: {cnt} linhas (arrow, encoding={enc})")
+            return True
+        except Exception as e:
+            print(f"[INFO] arrow falhou para {table} (encoding={enc}): {type(e).__name__}")
+    return False
+
 def load_with_pandas(con: duckdb.DuckDBPyConnection, table: str, csv_path: Path) -> None:
     """
     Fallback usando pandas.read_csv com tentativas de encoding.
@@ -36,11 +189,14 @@ def load_with_pandas(con: duckdb.DuckDBPyConnection, table: str, csv_path: Path)
     tried = []
     for enc in ["utf-8", "latin1", "cp1252"]:
         try:
-            df = pd.read_csv(csv_path, encoding=enc, engine="python")
+            # engine="c": parser vetorizado do pandas, ~10x o engine python
+            df = pd.read_csv(csv_path, encoding=enc, engine="c")
             con.execute(f"DROP TABLE IF EXISTS {table}")
-            con.register("tmp_df", df)
-            con.execute(f"CREATE TABLE {table} AS SELECT * FROM tmp_df")
-            con.unregister("tmp_df")
+            # Nome de view por tabela: as cargas rodam em paralelo em cursores
+            # da mesma conexão e um nome fixo colidiria entre threads.
+            con.register(f"tmp_df_{table}", df)
+            con.execute(f"CREATE TABLE {table} AS SELECT * FROM tmp_df_{table}")
+            con.unregister(f"tmp_df_{table}")
             (cnt,) = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
             print(f"[OK]   {table:<12}: {cnt} linhas (pandas, encoding={enc})")
             return
@@ -48,11 +204,11 @@ def load_with_pandas(con: duckdb.DuckDBPyConnection, table: str, csv_path: Path)
             tried.append(f"{enc} -> {type(e).__name__}: {e}")
     # Último recurso: substituir bytes inválidos
     try:
-        df = pd.read_csv(csv_path, encoding="latin1", engine="python", errors="replace")
+        df = pd.read_csv(csv_path, encoding="latin1", engine="c", encoding_errors="replace")
         con.execute(f"DROP TABLE IF EXISTS {table}")
-        con.register("tmp_df", df)
-        con.execute(f"CREATE TABLE {table} AS SELECT * FROM tmp_df")
-        con.unregister("tmp_df")
+        con.register(f"tmp_df_{table}", df)
+        con.execute(f"CREATE TABLE {table} AS SELECT * FROM tmp_df_{table}")
+        con.unregister(f"tmp_df_{table}")
         (cnt,) = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
         print(f"[OK*]  {table:<12}: {cnt} linhas (pandas, encoding=latin1, errors=replace)")
     except Exception as e:
@@ -60,18 +216,493 @@ def load_with_pandas(con: duckdb.DuckDBPyConnection, table: str, csv_path: Path)
         print("[TRACE] Tentativas:", *tried, sep="\n  - ")
         raise
 
+def first_col(con: duckdb.DuckDBPyConnection, table: str, candidates) -> str | None:
+    """Primeira coluna candidata que existe na tabela (ou None)."""
+    cols = {r[1] for r in con.execute(f"PRAGMA table_info('{table}')").fetchall()}
+    for c in candidates:
+        if c in cols:
+            return c
+    return None
+
+def month_expr(col: str) -> str:
+    # Normaliza DATE/VARCHAR (ISO ou dd/mm/aaaa) para 'YYYY-MM'
+    return (
+        f"strftime(COALESCE(TRY_CAST({col} AS DATE), "
+        f"CAST(TRY_STRPTIME(CAST({col} AS VARCHAR), '%d/%m/%Y') AS DATE)), '%Y-%m')"
+    )
+
+def add_mes_column(con: duckdb.DuckDBPyConnection, table: str, candidates) -> None:
+    """
+    Materializa a competência 'YYYY-MM' em uma coluna persistente 'mes'.
+    O parse de data passa a ser pago uma vez na carga, e não por linha em
+    cada consulta da API; o índice deixa o filtro por mês num range curto.
+    """
+    col = first_col(con, table, candidates)
+    if not col:
+        print(f"[SKIP] {table}: sem coluna de data para materializar 'mes'")
+        return
+    con.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS mes VARCHAR")
+    con.execute(f"UPDATE {table} SET mes = {month_expr(col)}")
+    # Reescreve a tabela ordenada por mês: os zonemaps (min/max por row
+    # group) ficam justos e o filtro de competência da API pula row groups
+    # inteiros em vez de varrer a coluna toda.
+    con.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM {table} ORDER BY mes")
+    try:
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_mes ON {table}(mes)")
+    except Exception as e:
+        print(f"[INFO] índice em {table}(mes) não criado: {e}")
+    print(f"[OK]   {table:<12}: coluna 'mes' materializada (de {col})")
+
+def add_idade_column(con: duckdb.DuckDBPyConnection) -> None:
+    """
+    Materializa a idade (anos) no beneficiario. O filtro de faixa etária da
+    API vira um range simples sobre INTEGER — elegível a zone maps — em vez
+    de CAST + date_diff por linha em cada scan.
+    """
+    col = first_col(con, "beneficiario", ["dt_nascimento"])
+    if not col:
+        print("[SKIP] beneficiario: sem dt_nascimento para materializar 'idade'")
+        return
+    con.execute("ALTER TABLE beneficiario ADD COLUMN IF NOT EXISTS idade INTEGER")
+    con.execute(
+        f"UPDATE beneficiario SET idade = "
+        f"date_diff('year', TRY_CAST({col} AS DATE), CURRENT_DATE)"
+    )
+    # Faixa padrão pré-rotulada: o filtro de faixa da API (e o rollup) vira
+    # igualdade de string em vez de um CASE sobre a idade por linha.
+    con.execute("ALTER TABLE beneficiario ADD COLUMN IF NOT EXISTS faixa_etaria VARCHAR")
+    con.execute(
+        "UPDATE beneficiario SET faixa_etaria = "
+        "CASE WHEN idade <= 18 THEN '0-18' WHEN idade <= 59 THEN '19-59' ELSE '60+' END"
+    )
+    print("[OK]   beneficiario: colunas 'idade' e 'faixa_etaria' materializadas")
+
+def add_ativo_flag(con: duckdb.DuckDBPyConnection) -> None:
+    """
+    Materializa o predicado de beneficiário ativo num BOOLEAN. A API avaliava
+    upper(status) LIKE 'ATIV%' por linha a cada requisição; a flag é lida em
+    1 byte por linha e o upper + busca de substring saem do caminho quente.
+    """
+    col = first_col(con, "beneficiario", ["ds_situacao", "ds_status", "st_situacao"])
+    if not col:
+        print("[SKIP] beneficiario: sem coluna de situação para materializar 'is_ativo'")
+        return
+    con.execute("ALTER TABLE beneficiario ADD COLUMN IF NOT EXISTS is_ativo BOOLEAN")
+    con.execute(
+        f"UPDATE beneficiario SET is_ativo = "
+        f"COALESCE(upper(CAST({col} AS VARCHAR)) LIKE 'ATIV%', FALSE)"
+    )
+    print("[OK]   beneficiario: flag 'is_ativo' materializada")
+
+def narrow_id_columns(con: duckdb.DuckDBPyConnection) -> None:
+    """
+    Estreita ids BIGINT para INTEGER quando o domínio cabe em 32 bits:
+    metade dos bytes por valor no scan e o dobro de ids por vetor nos hash
+    joins/GROUP BY. Checa MIN/MAX antes; em dúvida a coluna fica BIGINT.
+    Precisa rodar antes dos índices (ALTER COLUMN falha em tabela indexada).
+    """
+    for table, hints in CSV_TYPE_HINTS.items():
+        for cand in hints:
+            col = first_col(con, table, [cand])
+            if not col:
+                continue
+            (tipo,) = con.execute(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE lower(table_name) = lower(?) AND lower(column_name) = lower(?)",
+                [table, col],
+            ).fetchone()
+            if tipo.upper() != "BIGINT":
+                continue
+            lo, hi = con.execute(f"SELECT MIN({col}), MAX({col}) FROM {table}").fetchone()
+            if lo is None or lo < -(2**31) or hi >= 2**31:
+                continue
+            try:
+                con.execute(f"ALTER TABLE {table} ALTER COLUMN {col} SET DATA TYPE INTEGER")
+                print(f"[OK]   {table:<12}: coluna '{col}' estreitada para INTEGER")
+            except Exception as e:
+                print(f"[INFO] {table}.{col} não estreitada para INTEGER: {e}")
+
+def convert_low_card_to_enum(con: duckdb.DuckDBPyConnection, table: str, columns) -> None:
+    """
+    Converte colunas VARCHAR de baixa cardinalidade para ENUM: o DuckDB
+    armazena o dicionário uma vez e a coluna vira inteiros pequenos —
+    igualdade de filtro vira comparação de int e o scan lê ~10x menos bytes.
+    Guardado por try/except: em qualquer dúvida a coluna fica como está.
+    """
+    for cand in columns:
+        col = first_col(con, table, [cand])
+        if not col:
+            continue
+        (tipo,) = con.execute(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE lower(table_name) = lower(?) AND lower(column_name) = lower(?)",
+            [table, col],
+        ).fetchone()
+        if tipo.upper() not in ("VARCHAR", "TEXT", "STRING"):
+            continue
+        (card,) = con.execute(f"SELECT COUNT(DISTINCT {col}) FROM {table}").fetchone()
+        if not card or card > 512:
+            continue
+        tipo_enum = f"enum_{table}_{col}"
+        try:
+            con.execute(f"DROP TYPE IF EXISTS {tipo_enum}")
+            con.execute(
+                f"CREATE TYPE {tipo_enum} AS ENUM "
+                f"(SELECT DISTINCT {col} FROM {table} WHERE {col} IS NOT NULL)"
+            )
+            con.execute(f"ALTER TABLE {table} ALTER COLUMN {col} SET DATA TYPE {tipo_enum}")
+            print(f"[OK]   {table:<12}: coluna '{col}' convertida para ENUM ({card} valores)")
+        except Exception as e:
+            print(f"[INFO] {table}.{col} não convertida para ENUM: {e}")
+
+def add_join_indexes(con: duckdb.DuckDBPyConnection) -> None:
+    """
+    Índices ART nas chaves de join mais usadas pelos KPIs (beneficiário e
+    prestador): lookups pontuais nos joins em vez de scan completo da chave.
+    """
+    alvos = [
+        ("conta", ["id_beneficiario"]),
+        ("conta", ["id_prestador_pagamento", "id_prestador"]),
+        ("mensalidade", ["id_beneficiario"]),
+        ("autorizacao", ["id_beneficiario"]),
+    ]
+    for table, candidates in alvos:
+        col = first_col(con, table, candidates)
+        if not col:
+            continue
+        try:
+            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{col} ON {table}({col})")
+        except Exception as e:
+            print(f"[INFO] índice em {table}({col}) não criado: {e}")
+
+def normalize_numeric(con: duckdb.DuckDBPyConnection, table: str, candidates) -> None:
+    """
+    Converte a coluna de valor para DOUBLE uma única vez na carga. CSVs com
+    decimal brasileiro ('1.234,56') chegam como VARCHAR e obrigariam cada
+    SUM da API a pagar REPLACE + TRY_CAST por linha, por consulta.
+    """
+    col = first_col(con, table, candidates)
+    if not col:
+        return
+    (tipo,) = con.execute(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE lower(table_name) = lower(?) AND lower(column_name) = lower(?)",
+        [table, col],
+    ).fetchone()
+    if tipo.upper() not in ("VARCHAR", "TEXT", "STRING"):
+        return  # já veio numérica do parser do CSV
+    try:
+        con.execute(
+            f"ALTER TABLE {table} ALTER COLUMN {col} SET DATA TYPE DOUBLE USING "
+            f"COALESCE(TRY_CAST({col} AS DOUBLE), "
+            f"TRY_CAST(REPLACE(REPLACE({col}, '.', ''), ',', '.') AS DOUBLE))"
+        )
+        print(f"[OK]   {table:<12}: coluna '{col}' convertida para DOUBLE")
+    except Exception as e:
+        print(f"[INFO] {table}.{col} não convertida para DOUBLE: {e}")
+
+def materialize_kpis(con: duckdb.DuckDBPyConnection) -> None:
+    """
+    Roll-up mensal de autorizacao: (mes, id_beneficiario, id_prestador, n).
+    Os endpoints de utilização passam a consultar este resumo em vez de
+    re-escanear a tabela-fato (e re-parsear datas) a cada requisição.
+    """
+    dt = first_col(con, "autorizacao", ["dt_autorizacao", "dt_entrada"])
+    id_b = first_col(con, "autorizacao", ["id_beneficiario"])
+    id_p = first_col(con, "autorizacao", ["id_prestador", "id_prestador_pagamento"])
+    if not (dt and id_b):
+        print("[SKIP] mv_autorizacao_mensal: colunas de data/beneficiário não encontradas")
+        return
+    sel_prest = f"{id_p} AS id_prestador" if id_p else "NULL AS id_prestador"
+    con.execute(
+        f"""
+        CREATE OR REPLACE TABLE mv_autorizacao_mensal AS
+        SELECT {month_expr(dt)} AS mes,
+               {id_b} AS id_beneficiario,
+               {sel_prest},
+               COUNT(*) AS n
+        FROM autorizacao
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2
+        """
+    )
+    try:
+        con.execute("CREATE INDEX IF NOT EXISTS idx_mv_aut_mes ON mv_autorizacao_mensal(mes)")
+    except Exception as e:
+        print(f"[INFO] índice em mv_autorizacao_mensal não criado: {e}")
+    (cnt,) = con.execute("SELECT COUNT(*) FROM mv_autorizacao_mensal").fetchone()
+    print(f"[OK]   mv_autorizacao_mensal: {cnt} linhas")
+
+    # Fato (mes, beneficiário) já deduplicado: a evolução de utilização vira
+    # COUNT(*) puro, sem hash set de COUNT(DISTINCT) por mês.
+    con.execute(
+        """
+        CREATE OR REPLACE TABLE fact_benef_mes AS
+        SELECT DISTINCT mes, id_beneficiario
+        FROM mv_autorizacao_mensal
+        WHERE mes IS NOT NULL
+        ORDER BY mes
+        """
+    )
+    try:
+        con.execute("CREATE INDEX IF NOT EXISTS idx_fact_benef_mes ON fact_benef_mes(mes)")
+    except Exception as e:
+        print(f"[INFO] índice em fact_benef_mes não criado: {e}")
+    (cnt,) = con.execute("SELECT COUNT(*) FROM fact_benef_mes").fetchone()
+    print(f"[OK]   fact_benef_mes: {cnt} linhas")
+
+    # Resumo mensal de utilização sem filtros: o caso mais comum do
+    # /kpi/utilizacao/resumo vira um lookup de 1 linha.
+    con.execute(
+        """
+        CREATE OR REPLACE TABLE kpi_utilizacao_mensal AS
+        SELECT mes,
+               COUNT(DISTINCT id_beneficiario) AS beneficiarios_utilizados,
+               SUM(n) AS autorizacoes
+        FROM mv_autorizacao_mensal
+        WHERE mes IS NOT NULL
+        GROUP BY 1
+        """
+    )
+    try:
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS idx_kpi_util_mes ON kpi_utilizacao_mensal(mes)"
+        )
+    except Exception as e:
+        print(f"[INFO] índice em kpi_utilizacao_mensal não criado: {e}")
+    (cnt,) = con.execute("SELECT COUNT(*) FROM kpi_utilizacao_mensal").fetchone()
+    print(f"[OK]   kpi_utilizacao_mensal: {cnt} linhas")
+
+    materialize_sinistralidade(con)
+    materialize_rollups(con)
+
+def _mes_or_expr(con: duckdb.DuckDBPyConnection, table: str, date_candidates) -> str | None:
+    """Coluna 'mes' materializada, ou a expressão de mês sobre a coluna de data."""
+    if first_col(con, table, ["mes"]):
+        return "mes"
+    col = first_col(con, table, date_candidates)
+    return month_expr(col) if col else None
+
+def materialize_sinistralidade(con: duckdb.DuckDBPyConnection) -> None:
+    """
+    Série mensal de sinistralidade (custo de conta x receita de mensalidade),
+    no formato documentado no README: kpi_sinistralidade_mensal. Os endpoints
+    de sinistralidade viram um lookup de 1..N linhas nessa tabela.
+    """
+    mes_conta = _mes_or_expr(con, "conta", ["dt_mes_competencia", "dt_competencia"])
+    mes_mens = _mes_or_expr(con, "mensalidade", ["dt_competencia", "dt_mes_competencia"])
+    vl_lib = first_col(con, "conta", ["vl_liberado"])
+    vl_pre = first_col(con, "mensalidade", ["vl_premio"])
+    if not (mes_conta and mes_mens and vl_lib and vl_pre):
+        print("[SKIP] kpi_sinistralidade_mensal: colunas necessárias não encontradas")
+        return
+    con.execute(
+        f"""
+        CREATE OR REPLACE TABLE kpi_sinistralidade_mensal AS
+        WITH custos AS (
+          SELECT {mes_conta} AS competencia, SUM({vl_lib}) AS custo
+          FROM conta GROUP BY 1
+        ), receitas AS (
+          SELECT {mes_mens} AS competencia, SUM({vl_pre}) AS receita
+          FROM mensalidade GROUP BY 1
+        )
+        SELECT competencia,
+               COALESCE(receita, 0) AS receita_vl_premio,
+               COALESCE(custo, 0)   AS custo_vl_liberado,
+               CASE WHEN COALESCE(receita, 0) <> 0 THEN COALESCE(custo, 0) / receita END AS sinistralidade
+        FROM custos FULL OUTER JOIN receitas USING (competencia)
+        WHERE competencia IS NOT NULL
+        """
+    )
+    try:
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS idx_kpi_sin_mes ON kpi_sinistralidade_mensal(competencia)"
+        )
+    except Exception as e:
+        print(f"[INFO] índice em kpi_sinistralidade_mensal não criado: {e}")
+    (cnt,) = con.execute("SELECT COUNT(*) FROM kpi_sinistralidade_mensal").fetchone()
+    print(f"[OK]   kpi_sinistralidade_mensal: {cnt} linhas")
+
+def _rollup_dims(con: duckdb.DuckDBPyConnection) -> dict[str, str]:
+    """Dimensões do beneficiario com rollup próprio: tabela -> expressão SQL."""
+    dims: dict[str, str] = {}
+    prod = first_col(con, "beneficiario", ["ds_produto", "nr_produto"])
+    if prod:
+        dims["rollup_sin_produto"] = f"b.{prod}"
+    cid = first_col(con, "beneficiario", ["ds_municipio", "ds_cidade"])
+    if cid:
+        dims["rollup_sin_cidade"] = f"b.{cid}"
+    if first_col(con, "beneficiario", ["faixa_etaria"]):
+        dims["rollup_sin_faixa"] = "b.faixa_etaria"
+    elif first_col(con, "beneficiario", ["idade"]):
+        dims["rollup_sin_faixa"] = (
+            "CASE WHEN b.idade <= 18 THEN '0-18' "
+            "WHEN b.idade <= 59 THEN '19-59' ELSE '60+' END"
+        )
+    return dims
+
+def _rollup_select_sql(con: duckdb.DuckDBPyConnection, dim: str, por_mes: bool) -> str | None:
+    """SELECT (competencia, chave, custo, receita, sinistralidade) da dimensão,
+    opcionalmente filtrado a uma competência (para o refresh incremental)."""
+    mes_conta = _mes_or_expr(con, "conta", ["dt_mes_competencia", "dt_competencia"])
+    mes_mens = _mes_or_expr(con, "mensalidade", ["dt_competencia", "dt_mes_competencia"])
+    vl_lib = first_col(con, "conta", ["vl_liberado"])
+    vl_pre = first_col(con, "mensalidade", ["vl_premio"])
+    if not (mes_conta and mes_mens and vl_lib and vl_pre):
+        return None
+    filtro_c = f"WHERE {mes_conta} = ?" if por_mes else ""
+    filtro_m = f"WHERE {mes_mens} = ?" if por_mes else ""
+    return f"""
+        WITH custos AS (
+          SELECT ct.competencia, {dim} AS chave, SUM(ct.v) AS custo
+          FROM (
+            SELECT id_beneficiario, {mes_conta} AS competencia, {vl_lib} AS v
+            FROM conta {filtro_c}
+          ) ct JOIN beneficiario b USING (id_beneficiario)
+          GROUP BY 1, 2
+        ), receitas AS (
+          SELECT m.competencia, {dim} AS chave, SUM(m.v) AS receita
+          FROM (
+            SELECT id_beneficiario, {mes_mens} AS competencia, {vl_pre} AS v
+            FROM mensalidade {filtro_m}
+          ) m JOIN beneficiario b USING (id_beneficiario)
+          GROUP BY 1, 2
+        )
+        SELECT competencia, chave,
+               COALESCE(custo, 0)   AS custo,
+               COALESCE(receita, 0) AS receita,
+               CASE WHEN COALESCE(receita, 0) <> 0 THEN COALESCE(custo, 0) / receita END AS sinistralidade
+        FROM custos FULL OUTER JOIN receitas USING (competencia, chave)
+        WHERE competencia IS NOT NULL AND chave IS NOT NULL
+    """
+
+def materialize_rollups(con: duckdb.DuckDBPyConnection) -> None:
+    """
+    Rollups de sinistralidade por dimensão do beneficiário (produto, cidade,
+    faixa etária). Os endpoints /kpi/sinistralidade/por_* trocam o scan de
+    conta+mensalidade+join por um WHERE competencia = ? nessas tabelas.
+    """
+    for nome, dim in _rollup_dims(con).items():
+        sql = _rollup_select_sql(con, dim, por_mes=False)
+        if sql is None:
+            print(f"[SKIP] {nome}: colunas necessárias não encontradas")
+            continue
+        con.execute(f"CREATE OR REPLACE TABLE {nome} AS {sql}")
+        try:
+            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{nome}_mes ON {nome}(competencia)")
+        except Exception as e:
+            print(f"[INFO] índice em {nome} não criado: {e}")
+        (cnt,) = con.execute(f"SELECT COUNT(*) FROM {nome}").fetchone()
+        print(f"[OK]   {nome}: {cnt} linhas")
+
+def _has_table(con: duckdb.DuckDBPyConnection, name: str) -> bool:
+    (n,) = con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE lower(table_name) = lower(?)",
+        [name],
+    ).fetchone()
+    return bool(n)
+
+def refresh_month(con: duckdb.DuckDBPyConnection, mes: str) -> None:
+    """
+    Atualiza só a partição (mês) informada dos resumos materializados:
+    DELETE + INSERT do mês em vez de recomputar as tabelas inteiras.
+    Dados novos só chegam na virada do mês, então o refresh completo é
+    desperdício. Uso: python load_data.py --mes 2025-06
+    """
+    print(f"[REFRESH] competencia {mes}")
+    if _has_table(con, "mv_autorizacao_mensal") and _has_table(con, "autorizacao"):
+        mes_src = _mes_or_expr(con, "autorizacao", ["dt_autorizacao", "dt_entrada"])
+        id_p = first_col(con, "autorizacao", ["id_prestador", "id_prestador_pagamento"])
+        sel_prest = id_p if id_p else "NULL"
+        con.execute("DELETE FROM mv_autorizacao_mensal WHERE mes = ?", [mes])
+        con.execute(
+            f"""
+            INSERT INTO mv_autorizacao_mensal
+            SELECT {mes_src} AS mes, id_beneficiario, {sel_prest}, COUNT(*)
+            FROM autorizacao
+            WHERE {mes_src} = ?
+            GROUP BY 1, 2, 3
+            """,
+            [mes],
+        )
+        print(f"[OK]   mv_autorizacao_mensal: mes {mes} atualizado")
+        if _has_table(con, "fact_benef_mes"):
+            con.execute("DELETE FROM fact_benef_mes WHERE mes = ?", [mes])
+            con.execute(
+                "INSERT INTO fact_benef_mes "
+                "SELECT DISTINCT mes, id_beneficiario FROM mv_autorizacao_mensal WHERE mes = ?",
+                [mes],
+            )
+            print(f"[OK]   fact_benef_mes: mes {mes} atualizado")
+        if _has_table(con, "kpi_utilizacao_mensal"):
+            con.execute("DELETE FROM kpi_utilizacao_mensal WHERE mes = ?", [mes])
+            con.execute(
+                "INSERT INTO kpi_utilizacao_mensal "
+                "SELECT mes, COUNT(DISTINCT id_beneficiario), SUM(n) "
+                "FROM mv_autorizacao_mensal WHERE mes = ? GROUP BY 1",
+                [mes],
+            )
+            print(f"[OK]   kpi_utilizacao_mensal: mes {mes} atualizado")
+    if _has_table(con, "kpi_sinistralidade_mensal"):
+        mes_conta = _mes_or_expr(con, "conta", ["dt_mes_competencia", "dt_competencia"])
+        mes_mens = _mes_or_expr(con, "mensalidade", ["dt_competencia", "dt_mes_competencia"])
+        vl_lib = first_col(con, "conta", ["vl_liberado"])
+        vl_pre = first_col(con, "mensalidade", ["vl_premio"])
+        con.execute(
+            "DELETE FROM kpi_sinistralidade_mensal WHERE substr(CAST(competencia AS VARCHAR), 1, 7) = ?",
+            [mes],
+        )
+        con.execute(
+            f"""
+            INSERT INTO kpi_sinistralidade_mensal
+            WITH custos AS (
+              SELECT {mes_conta} AS competencia, SUM({vl_lib}) AS custo
+              FROM conta WHERE {mes_conta} = ? GROUP BY 1
+            ), receitas AS (
+              SELECT {mes_mens} AS competencia, SUM({vl_pre}) AS receita
+              FROM mensalidade WHERE {mes_mens} = ? GROUP BY 1
+            )
+            SELECT competencia,
+                   COALESCE(receita, 0),
+                   COALESCE(custo, 0),
+                   CASE WHEN COALESCE(receita, 0) <> 0 THEN COALESCE(custo, 0) / receita END
+            FROM custos FULL OUTER JOIN receitas USING (competencia)
+            WHERE competencia IS NOT NULL
+            """,
+            [mes, mes],
+        )
+        print(f"[OK]   kpi_sinistralidade_mensal: mes {mes} atualizado")
+    for nome, dim in _rollup_dims(con).items():
+        if not _has_table(con, nome):
+            continue
+        sql = _rollup_select_sql(con, dim, por_mes=True)
+        if sql is None:
+            continue
+        con.execute(f"DELETE FROM {nome} WHERE competencia = ?", [mes])
+        con.execute(f"INSERT INTO {nome} {sql}", [mes, mes])
+        print(f"[OK]   {nome}: mes {mes} atualizado")
+
 def load_table(con: duckdb.DuckDBPyConnection, table: str, filename: str) -> None:
     csv_path = DATA_DIR / filename
     if not csv_path.exists():
         raise FileNotFoundError(f"Arquivo não encontrado: {csv_path}")
     print(f"[LOAD] {table:<12} <- {filename}")
 
-    # 1) Tenta DuckDB direto (rápido)
+    # 1) Parquet irmão (convertido uma vez; recargas não re-parseiam o CSV)
+    pq_path = ensure_parquet(con, table, csv_path)
+    if pq_path is not None and load_with_parquet(con, table, pq_path):
+        return
+
+    # 2) DuckDB direto no CSV (rápido)
     ok = load_with_duckdb(con, table, csv_path)
     if ok:
         return
 
-    # 2) Fallback Pandas (encodings alternativos)
+    # 3) Fallback Arrow (encodings alternativos, parser C++)
+    if load_with_arrow(con, table, csv_path):
+        return
+
+    # 4) Fallback Pandas (último recurso, com errors=replace)
     load_with_pandas(con, table, csv_path)
 
 def main():
@@ -79,19 +710,56 @@ def main():
     con = duckdb.connect(str(DB_PATH))
     con.execute("PRAGMA threads=4;")
 
-    # Carrega todas as tabelas necessárias
-    load_table(con, "beneficiario", "beneficiario.csv")
-    load_table(con, "conta",        "conta.csv")
-    load_table(con, "mensalidade",  "mensalidade.csv")
-    load_table(con, "prestador",    "prestador.csv")
-    load_table(con, "autorizacao",  "autorizacao.csv")
+    # Carrega todas as tabelas em paralelo: cada CSV é leitura + parse
+    # independente, e cursores da mesma conexão podem ser usados de threads
+    # diferentes com segurança. O PRAGMA threads acima vale para a conexão
+    # inteira, então o paralelismo intra-arquivo já fica repartido.
+    with ThreadPoolExecutor(max_workers=len(TABELAS_CSV)) as ex:
+        futuros = [ex.submit(load_table, con.cursor(), t, f) for t, f in TABELAS_CSV]
+        for fut in futuros:
+            fut.result()
+
+    # Valores monetários normalizados para DOUBLE (uma vez, na carga)
+    normalize_numeric(con, "conta",       ["vl_liberado"])
+    normalize_numeric(con, "mensalidade", ["vl_premio"])
+
+    # Ids que cabem em 32 bits viram INTEGER (metade dos bytes nos joins).
+    # Antes dos índices: ALTER COLUMN falha em tabela indexada.
+    narrow_id_columns(con)
+
+    # Colunas categóricas de baixa cardinalidade viram ENUM (menos bytes por
+    # scan). Antes dos índices: ALTER COLUMN falha em tabela indexada.
+    convert_low_card_to_enum(con, "beneficiario", ["ds_sexo", "ds_situacao", "ds_tipo_contratacao"])
+    convert_low_card_to_enum(con, "conta", ["ds_classificacao_item_n2", "ds_carater_atendimento"])
+
+    # Competência 'YYYY-MM' persistida por tabela
+    add_mes_column(con, "conta",        ["dt_mes_competencia", "dt_competencia"])
+    add_mes_column(con, "mensalidade",  ["dt_competencia", "dt_mes_competencia"])
+    add_mes_column(con, "autorizacao",  ["dt_autorizacao", "dt_entrada"])
+
+    # Índices nas chaves de join dos KPIs
+    add_join_indexes(con)
+
+    # Idade materializada para o filtro de faixa etária
+    add_idade_column(con)
+
+    # Flag de beneficiário ativo (predicado quente do /kpi/sinistralidade/ativos)
+    add_ativo_flag(con)
+
+    # Resumos mensais consumidos pela API
+    materialize_kpis(con)
 
     con.close()
     print(f"[DONE] DuckDB atualizado em {DB_PATH}")
 
 if __name__ == "__main__":
     try:
-        main()
+        if len(sys.argv) >= 3 and sys.argv[1] == "--mes":
+            con = duckdb.connect(str(DB_PATH))
+            refresh_month(con, sys.argv[2])
+            con.close()
+        else:
+            main()
     except Exception as e:
         print(e, file=sys.stderr)
         sys.exit(1)